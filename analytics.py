@@ -0,0 +1,231 @@
+import argparse, os, sqlite3, sys, threading, time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+# Vectorized attendance analytics for /admin/analytics. Attendance rows of
+# the current term are loaded once into columnar NumPy arrays; heatmaps,
+# per-class attendance rates and weekly trends are then bincount/unique
+# group-bys over those arrays instead of Python loops or repeated SQL scans.
+# Compare with the equivalent SQL on any database:
+#
+#   python analytics.py --benchmark [--db database.db] [--from YYYY-MM-DD] [--to YYYY-MM-DD]
+
+ANALYTICS_TTL = 300  # seconds a result is reused while attendance is unchanged
+
+EPOCH = date(1970, 1, 1)
+DAY_NAMES = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+# ---------------- LOADING ----------------
+class Columns:
+    # One entry per attendance row. `day` counts local days since 1970-01-01,
+    # `weekday` is Monday=0 like Python's date.weekday().
+    def __init__(self, timestamp, class_id, student):
+        self.timestamp = timestamp
+        self.class_id = class_id
+        self.student = student
+        local = timestamp + local_offsets(timestamp)
+        self.day = local // 86400
+        self.weekday = (self.day + 3) % 7  # 1970-01-01 was a Thursday
+        self.hour = (local % 86400) // 3600
+        self.distinct = None  # filled by student_days()
+
+    def __len__(self):
+        return len(self.timestamp)
+
+def local_offsets(timestamp):
+    # UTC offset of each timestamp, looked up once per distinct UTC hour so
+    # DST changes land on the right rows
+    if not len(timestamp):
+        return np.zeros(0, dtype=np.int64)
+    hours, inverse = np.unique(timestamp // 3600, return_inverse=True)
+    offsets = np.array([time.localtime(int(h) * 3600).tm_gmtoff for h in hours], dtype=np.int64)
+    return offsets[inverse]
+
+def load_columns(conn, start_ts, end_ts):
+    # Students are keyed by users.rowid so group-bys work on integers
+    rows = conn.execute("""
+        SELECT a.timestamp, a.class_id, u.rowid
+        FROM attendance a
+        JOIN users u ON u.email = a.email
+        WHERE a.timestamp >= ? AND a.timestamp < ?
+    """, (start_ts, end_ts)).fetchall()
+    data = np.array(rows, dtype=np.int64).reshape(-1, 3)
+    return Columns(data[:, 0], data[:, 1], data[:, 2])
+
+# ---------------- AGGREGATES ----------------
+def heatmap(cols):
+    # 7x24 check-in counts, weekday by local hour
+    return np.bincount(cols.weekday * 24 + cols.hour, minlength=7 * 24).reshape(7, 24)
+
+def student_days(cols):
+    # Distinct (student, class, day) triples as three arrays, sorted once
+    # per load and shared by the rate and trend aggregates
+    if cols.distinct is None:
+        keys = np.unique((cols.student << 40) | (cols.class_id << 20) | cols.day)
+        cols.distinct = (keys >> 40, (keys >> 20) & 0xFFFFF, keys & 0xFFFFF)
+    return cols.distinct
+
+def class_rates(cols, schedule, enrolled, sessions):
+    # schedule: {class_id: {weekday, ...}}; enrolled/sessions: {class_id: n}.
+    # A student is present on a scheduled day if they checked in to that
+    # class that day, as on the reports page.
+    _, class_id, day = student_days(cols)
+    size = max([0, *schedule, *enrolled, int(class_id.max()) if len(class_id) else 0]) + 1
+    scheduled = np.zeros((size, 7), dtype=bool)
+    for cid, weekdays in schedule.items():
+        scheduled[cid, list(weekdays)] = True
+    on_schedule = scheduled[class_id, (day + 3) % 7]
+    present = np.bincount(class_id[on_schedule], minlength=size)
+    rates = {}
+    for cid in set(enrolled) | set(schedule):
+        expected = enrolled.get(cid, 0) * sessions.get(cid, 0)
+        rates[cid] = {"present": int(present[cid]), "expected": expected,
+                      "percent": round(100.0 * int(present[cid]) / expected, 1) if expected else None}
+    return rates
+
+def weekly_trend(cols, start, end):
+    # Check-ins and distinct student-days per week (weeks start on Monday)
+    first = (start - timedelta(days=start.weekday()) - EPOCH).days
+    weeks = ((end - EPOCH).days - first) // 7 + 1
+    checkins = np.bincount((cols.day - first) // 7, minlength=weeks)[:weeks]
+    _, _, day = student_days(cols)
+    present = np.bincount((day - first) // 7, minlength=weeks)[:weeks]
+    return [{"week": EPOCH + timedelta(days=first + 7 * i), "checkins": int(checkins[i]),
+             "student_days": int(present[i])} for i in range(weeks)]
+
+def compute(conn, start, end, schedule, enrolled, sessions):
+    start_ts = int(datetime.combine(start, datetime.min.time()).timestamp())
+    end_ts = int(datetime.combine(end + timedelta(days=1), datetime.min.time()).timestamp())
+    cols = load_columns(conn, start_ts, end_ts)
+    return {
+        "rows": len(cols),
+        "heatmap": heatmap(cols).tolist(),
+        "classes": class_rates(cols, schedule, enrolled, sessions),
+        "weeks": weekly_trend(cols, start, end),
+    }
+
+# ---------------- CACHE ----------------
+class AnalyticsCache:
+    # Keeps results per (range, data version); the version is the newest
+    # attendance id, so a refresh with no new check-ins costs one query.
+    def __init__(self, ttl=ANALYTICS_TTL, size=16):
+        self.ttl = ttl
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._results = {}
+        self._lock = threading.Lock()
+
+    def get(self, conn, start, end, load_inputs):
+        version = conn.execute("SELECT COALESCE(MAX(id), 0) FROM attendance").fetchone()[0]
+        key = (start, end, version)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._results.get(key)
+            if entry and now - entry[1] <= self.ttl:
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        result = compute(conn, start, end, *load_inputs())
+        result["computed_at"] = datetime.now()
+        with self._lock:
+            self._results[key] = (result, now)
+            for old in sorted(self._results, key=lambda k: self._results[k][1])[:-self.size]:
+                del self._results[old]
+        return result
+
+# ---------------- BENCHMARK ----------------
+WEEKDAY_SQL = "(CAST(strftime('%w', {col}) AS INTEGER) + 6) % 7"
+
+def sql_heatmap(conn, start_ts, end_ts):
+    grid = np.zeros((7, 24), dtype=np.int64)
+    for wd, hour, n in conn.execute(f"""
+        SELECT {WEEKDAY_SQL.format(col="a.timestamp, 'unixepoch', 'localtime'")},
+               CAST(strftime('%H', a.timestamp, 'unixepoch', 'localtime') AS INTEGER), COUNT(*)
+        FROM attendance a JOIN users u ON u.email = a.email
+        WHERE a.timestamp >= ? AND a.timestamp < ?
+        GROUP BY 1, 2
+    """, (start_ts, end_ts)):
+        grid[wd, hour] = n
+    return grid
+
+def sql_class_present(conn, start_ts, end_ts, schedule):
+    present = {}
+    for class_id, wd, n in conn.execute(f"""
+        SELECT class_id, {WEEKDAY_SQL.format(col="d")}, COUNT(*)
+        FROM (SELECT DISTINCT a.email, a.class_id, date(a.timestamp, 'unixepoch', 'localtime') AS d
+              FROM attendance a JOIN users u ON u.email = a.email
+              WHERE a.timestamp >= ? AND a.timestamp < ?)
+        GROUP BY 1, 2
+    """, (start_ts, end_ts)):
+        if wd in schedule.get(class_id, ()):
+            present[class_id] = present.get(class_id, 0) + n
+    return present
+
+def sql_weekly(conn, start_ts, end_ts, start):
+    monday = (start - timedelta(days=start.weekday())).isoformat()
+    return dict(conn.execute("""
+        SELECT CAST((julianday(date(a.timestamp, 'unixepoch', 'localtime')) - julianday(?)) / 7 AS INTEGER), COUNT(*)
+        FROM attendance a JOIN users u ON u.email = a.email
+        WHERE a.timestamp >= ? AND a.timestamp < ?
+        GROUP BY 1
+    """, (monday, start_ts, end_ts)).fetchall())
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+def benchmark(db_path, start=None, end=None):
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    if start is None:
+        first = conn.execute("SELECT MIN(timestamp) FROM attendance").fetchone()[0]
+        start = datetime.fromtimestamp(first).date() if first else date.today()
+    end = end or date.today()
+    start_ts = int(datetime.combine(start, datetime.min.time()).timestamp())
+    end_ts = int(datetime.combine(end + timedelta(days=1), datetime.min.time()).timestamp())
+    schedule = {}
+    for class_id, day in conn.execute("SELECT DISTINCT class_id, day FROM class_schedule"):
+        if day in DAY_NAMES:
+            schedule.setdefault(class_id, set()).add(DAY_NAMES.index(day))
+    enrolled = dict(conn.execute("SELECT class_id, COUNT(*) FROM student_profile GROUP BY class_id").fetchall())
+
+    cols, t_load = timed(load_columns, conn, start_ts, end_ts)
+    grid, t_heat = timed(heatmap, cols)
+    rates, t_rates = timed(class_rates, cols, schedule, enrolled, {})
+    weeks, t_weeks = timed(weekly_trend, cols, start, end)
+
+    sql_grid, s_heat = timed(sql_heatmap, conn, start_ts, end_ts)
+    sql_present, s_rates = timed(sql_class_present, conn, start_ts, end_ts, schedule)
+    sql_weeks, s_weeks = timed(sql_weekly, conn, start_ts, end_ts, start)
+    conn.close()
+
+    checks = {
+        "heatmap": np.array_equal(grid, sql_grid),
+        "class rates": all(rates.get(c, {"present": 0})["present"] == n for c, n in sql_present.items())
+                       and sum(r["present"] for r in rates.values()) == sum(sql_present.values()),
+        "weekly trend": all(sql_weeks.get(i, 0) == w["checkins"] for i, w in enumerate(weeks)),
+    }
+    print(f"{len(cols)} attendance rows, {start} .. {end}; loading into arrays took {t_load * 1000:.1f} ms")
+    print(f"{'aggregate':<14}{'numpy ms':>10}{'sql ms':>10}{'same':>7}")
+    for name, t_np, t_sql in (("heatmap", t_heat, s_heat), ("class rates", t_rates, s_rates),
+                              ("weekly trend", t_weeks, s_weeks)):
+        print(f"{name:<14}{t_np * 1000:>10.1f}{t_sql * 1000:>10.1f}{'yes' if checks[name] else 'NO':>7}")
+    return all(checks.values())
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Attendance analytics")
+    parser.add_argument("--benchmark", action="store_true", help="compare NumPy aggregates with SQL")
+    parser.add_argument("--db", default=os.environ.get("CLOUD_ATTENDANCE_DB",
+                        os.path.join(os.path.dirname(os.path.abspath(__file__)), "database.db")))
+    parser.add_argument("--from", dest="start", type=date.fromisoformat)
+    parser.add_argument("--to", dest="end", type=date.fromisoformat)
+    args = parser.parse_args(argv)
+    if not args.benchmark:
+        parser.print_help()
+        return 0
+    return 0 if benchmark(args.db, args.start, args.end) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,146 +1,969 @@
-from flask import Flask, render_template, request, redirect, session
-import sqlite3, random, time, os
+from flask import (Flask, render_template, request, redirect, session, g, Response, stream_with_context, jsonify,
+                   has_request_context, before_render_template, template_rendered, make_response, abort)
+from markupsafe import Markup
+from werkzeug.exceptions import RequestEntityTooLarge
+import sqlite3, random, time, os, threading, queue, atexit, csv, io, json, hashlib, math, re, fcntl, gzip
+import multiprocessing
+import click
 from functools import wraps
-from datetime import datetime
+from contextlib import contextmanager
+from collections import OrderedDict
+import urllib.parse
+from urllib.parse import urlencode
+from datetime import datetime, date
+try:
+    import brotli  # optional: Brotli responses when installed
+except ImportError:
+    brotli = None
+from migrations import SCHEMA_VERSION, DEFAULT_CLASS_CODE, current_version
 
 app = Flask(__name__)
 app.secret_key = "cloud-attendance-secret"
+# Uploads (roster CSVs) are read into memory; larger requests get a 413
+app.config["MAX_CONTENT_LENGTH"] = int(os.environ.get("CLOUD_ATTENDANCE_MAX_UPLOAD_MB", "16")) * 2**20
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_PATH = os.path.join(BASE_DIR, "database.db")
+DB_PATH = os.environ.get("CLOUD_ATTENDANCE_DB", os.path.join(BASE_DIR, "database.db"))
+ARCHIVE_DIR = os.environ.get("CLOUD_ATTENDANCE_ARCHIVE_DIR", os.path.join(BASE_DIR, "archive"))
 
-DEFAULT_CLASS_CODE = "IT123"
+OTP_TTL = 60  # seconds an OTP stays valid
 
 # ---------------- DATABASE ----------------
-def get_db():
-    conn = sqlite3.connect(DB_PATH)
+DB_POOL_SIZE = int(os.environ.get("CLOUD_ATTENDANCE_DB_POOL", "8"))
+DB_BUSY_TIMEOUT_MS = 5000
+DB_CACHE_KIB = 16384  # page cache per connection (16 MiB)
+
+def connect():
+    # Every connection gets the same tuning: WAL so readers never block the
+    # writer, a busy timeout instead of instant "database is locked", and a
+    # bigger statement cache so the hot queries stay prepared.
+    conn = sqlite3.connect(DB_PATH, timeout=DB_BUSY_TIMEOUT_MS / 1000,
+                           check_same_thread=False, cached_statements=256, uri=True)
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA foreign_keys=ON")
+    conn.execute(f"PRAGMA cache_size=-{DB_CACHE_KIB}")
     return conn
 
-def init_db():
-    conn = get_db()
-    cur = conn.cursor()
+class ConnectionPool:
+    # Keeps up to `size` idle connections; extra ones are opened on demand
+    # and closed again when released.
+    def __init__(self, size, opener=connect):
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._opener = opener
 
-    # USERS
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS users (
-        email TEXT PRIMARY KEY,
-        password TEXT NOT NULL,
-        role TEXT CHECK(role IN ('admin','teacher','student')),
-        name TEXT
-    )
-    """)
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._opener()
 
-    # DEFAULT ADMIN
-    cur.execute("""
-    INSERT OR IGNORE INTO users (email, password, role, name)
-    VALUES ('admin@cloud.com', 'admin123', 'admin', 'Admin')
-    """)
+    def release(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put_nowait(conn)
+        except (sqlite3.Error, queue.Full):
+            conn.close()
 
-    # CLASSES
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS classes (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL,
-        dept TEXT NOT NULL,
-        class_code TEXT UNIQUE NOT NULL
-    )
-    """)
+    def idle(self):
+        return self._idle.qsize()
 
-    # DEFAULT CLASS
-    cur.execute("""
-    INSERT OR IGNORE INTO classes (name, dept, class_code)
-    VALUES ('IT-A', 'IT', ?)
-    """, (DEFAULT_CLASS_CODE,))
+db_pool = ConnectionPool(DB_POOL_SIZE)
 
-    # CLASS SCHEDULE
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS class_schedule (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        class_id INTEGER,
-        day TEXT,
-        start_time TEXT,
-        end_time TEXT,
-        FOREIGN KEY (class_id) REFERENCES classes(id)
-    )
-    """)
+def get_db():
+    # One pooled connection per request, returned in close_db().
+    # Wrapped so every query's count and time lands in the request metrics.
+    if "db" not in g:
+        with metrics.phase("wait"):
+            conn = db_pool.acquire()
+        g.db = TimedConnection(conn)
+    return g.db
+
+@app.teardown_appcontext
+def close_db(exc):
+    conn = g.pop("db", None)
+    if conn is not None:
+        db_pool.release(conn.raw)
+    conn = g.pop("report_db", None)
+    if conn is not None:
+        g.pop("report_pool").release(conn.raw)
+
+def check_schema():
+    # Migrations run from `python migrations.py`; workers only compare versions
+    conn = connect()
+    version = current_version(conn)
+    conn.close()
+    if version != SCHEMA_VERSION:
+        raise RuntimeError(
+            f"Database schema is at version {version}, app expects {SCHEMA_VERSION}. "
+            "Run `python migrations.py` first."
+        )
 
-    # STUDENT PROFILE
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS student_profile (
-        email TEXT PRIMARY KEY,
-        class_id INTEGER,
-        FOREIGN KEY (email) REFERENCES users(email),
-        FOREIGN KEY (class_id) REFERENCES classes(id)
-    )
-    """)
+check_schema()
+
+# ---------------- REPORT SNAPSHOT ----------------
+# With CLOUD_ATTENDANCE_REPORTING=snapshot, the admin dashboard, exports,
+# reports and analytics read from a copy of the database instead of the
+# live file, so long reporting scans never hold up /submit_otp. The copy is
+# made with SQLite's online backup API (one read transaction, which WAL
+# never makes writers wait on) into a temp file that os.replace() swaps in;
+# readers still on the old file finish on it. gunicorn builds the first copy
+# before starting workers (when_ready in gunicorn.conf.py); only a request
+# that finds no copy at all waits for one. Past half of SNAPSHOT_MAX_AGE a
+# background thread rebuilds it while the current copy is still served, so
+# a copy is only older than SNAPSHOT_MAX_AGE while a refresh is running (or
+# failing, which is logged). A lock file keeps workers from copying at the
+# same time.
+REPORTING_MODE = os.environ.get("CLOUD_ATTENDANCE_REPORTING", "live")
+SNAPSHOT_PATH = os.environ.get("CLOUD_ATTENDANCE_SNAPSHOT", os.path.splitext(DB_PATH)[0] + ".snapshot.db")
+SNAPSHOT_MAX_AGE = int(os.environ.get("CLOUD_ATTENDANCE_SNAPSHOT_MAX_AGE", "300"))  # seconds
+SNAPSHOT_POOL_SIZE = 4
+
+class ReportSnapshot:
+    def __init__(self, path=SNAPSHOT_PATH, max_age=SNAPSHOT_MAX_AGE, pool_size=SNAPSHOT_POOL_SIZE):
+        self.path = path
+        self.max_age = max_age
+        self.refresh_after = max_age / 2
+        self.pool_size = pool_size
+        self.refreshes = 0
+        self._pool = None
+        self._generation = None  # (inode, mtime) of the file _pool reads
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def taken_at(self):
+        # The copy's mtime is set to when it was taken; None if there is none
+        try:
+            return os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def age(self):
+        taken_at = self.taken_at()
+        return None if taken_at is None else time.time() - taken_at
+
+    def refresh(self, older_than=0):
+        # Rebuilds the copy unless another worker made one younger than
+        # `older_than` seconds while we waited for the lock
+        with open(self.path + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            age = self.age()
+            if age is not None and age < older_than:
+                return False
+            tmp = f"{self.path}.tmp-{os.getpid()}"
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            taken_at = time.time()
+            src = connect()
+            dst = sqlite3.connect(tmp)
+            try:
+                src.backup(dst)
+                # A plain rollback-journal file, so readers can open it
+                # immutable with no -wal/-shm files beside it
+                dst.execute("PRAGMA journal_mode=DELETE")
+                dst.execute("INSERT OR REPLACE INTO app_state (key, value) VALUES ('snapshot_taken_at', ?)",
+                            (int(taken_at),))
+                dst.commit()
+            finally:
+                dst.close()
+                src.close()
+            os.utime(tmp, (taken_at, taken_at))
+            os.replace(tmp, self.path)
+            self.refreshes += 1
+            return True
+
+    def acquire(self):
+        # Returns (pool, connection, taken_at); waits for a copy only if
+        # there is none yet
+        age = self.age()
+        if age is None:
+            self.refresh(older_than=self.max_age)
+        elif age > self.refresh_after:
+            self._refresh_in_background()
+        st = os.stat(self.path)
+        with self._lock:
+            if (st.st_ino, st.st_mtime) != self._generation:
+                # Connections of the old pool still read the replaced file;
+                # they are closed once released and garbage-collected
+                self._pool = ConnectionPool(self.pool_size, self._connect)
+                self._generation = (st.st_ino, st.st_mtime)
+            pool = self._pool
+        return pool, pool.acquire(), st.st_mtime
+
+    def _connect(self):
+        conn = sqlite3.connect("file:" + urllib.parse.quote(self.path) + "?immutable=1", uri=True,
+                               check_same_thread=False, cached_statements=256)
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA cache_size=-{DB_CACHE_KIB}")
+        return conn
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh(older_than=self.refresh_after)
+            except (OSError, sqlite3.Error):
+                app.logger.exception("Report snapshot refresh failed")
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, name="report-snapshot", daemon=True).start()
+
+if REPORTING_MODE not in ("live", "snapshot"):
+    raise ValueError(f"Unknown reporting mode: {REPORTING_MODE}")
+report_snapshot = ReportSnapshot() if REPORTING_MODE == "snapshot" else None
+
+def get_report_db():
+    # Connection for admin reporting reads: the snapshot in snapshot mode,
+    # otherwise the request's live connection. g.report_taken_at tells
+    # templates how old the data is.
+    if report_snapshot is None:
+        return get_db()
+    if "report_db" not in g:
+        with metrics.phase("wait"):
+            g.report_pool, conn, taken_at = report_snapshot.acquire()
+        g.report_db = TimedConnection(conn)
+        g.report_taken_at = datetime.fromtimestamp(taken_at)
+    return g.report_db
+
+@app.cli.command("refresh-snapshot")
+def refresh_snapshot_command():
+    """Rebuild the reporting snapshot now (e.g. from cron)."""
+    (report_snapshot or ReportSnapshot()).refresh()
+    print(f"snapshot written to {SNAPSHOT_PATH}")
+
+# ---------------- METRICS ----------------
+# Per-process request metrics in Prometheus text format on /metrics.
+# Recording is a dict update under a lock; the text (and every gauge) is only
+# built when something scrapes. Each worker process reports its own numbers.
+# Without a token only loopback clients (a local Prometheus or sidecar) may
+# scrape: endpoint names and request rates are not for everyone
+METRICS_TOKEN = os.environ.get("CLOUD_ATTENDANCE_METRICS_TOKEN")
+METRICS_LOCAL_ADDRS = ("127.0.0.1", "::1")
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+class Metrics:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+        self._counters = {}    # (name, labels) -> value
+        self._lock = threading.Lock()
+
+    def observe(self, name, labels, value):
+        key = (name, labels)
+        with self._lock:
+            h = self._histograms.get(key)
+            if h is None:
+                h = self._histograms[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    h[i] += 1
+                    break
+            h[-2] += value
+            h[-1] += 1
+
+    def inc(self, name, labels, value=1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    @contextmanager
+    def phase(self, name):
+        # Adds the block's wall time to g.phases[name] of the current request
+        if not has_request_context():
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            phases = g.setdefault("phases", {})
+            phases[name] = phases.get(name, 0.0) + time.perf_counter() - start
+
+    def render(self, gauges):
+        with self._lock:
+            histograms = {k: list(v) for k, v in self._histograms.items()}
+            counters = dict(self._counters)
+        lines = []
+        typed = set()
+        def header(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+        for (name, labels), h in sorted(histograms.items()):
+            header(name, "histogram")
+            cumulative = 0
+            for bound, n in zip(self.buckets, h):
+                cumulative += n
+                lines.append(f'{name}_bucket{format_labels(labels + (("le", str(bound)),))} {cumulative}')
+            lines.append(f'{name}_bucket{format_labels(labels + (("le", "+Inf"),))} {h[-1]}')
+            lines.append(f"{name}_sum{format_labels(labels)} {h[-2]:.6f}")
+            lines.append(f"{name}_count{format_labels(labels)} {h[-1]}")
+        for (name, labels), value in sorted(counters.items()):
+            header(name, "counter")
+            lines.append(f"{name}{format_labels(labels)} {value:g}")
+        for name, kind, value in gauges:
+            header(name, kind)
+            lines.append(f"{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+metrics = Metrics()
+
+class TimedCursor:
+    # Counts and times execute/fetch calls on behalf of its TimedConnection
+    def __init__(self, cursor, owner):
+        self._cursor = cursor
+        self._owner = owner
+
+    def _timed(self, fn, *args, query=False):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self._owner.sql_seconds += time.perf_counter() - start
+            if query:
+                self._owner.queries += 1
 
-    # TEACHER PROFILE
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS teacher_profile (
-        email TEXT PRIMARY KEY,
-        dept TEXT,
-        FOREIGN KEY (email) REFERENCES users(email)
-    )
-    """)
+    def execute(self, *args):
+        if self._owner.statements is not None:
+            self._owner.statements.append(args)
+        self._timed(self._cursor.execute, *args, query=True)
+        return self
 
-    # TEACHER → CLASS
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS teacher_class (
-        email TEXT,
-        class_id INTEGER,
-        PRIMARY KEY (email, class_id),
-        FOREIGN KEY (email) REFERENCES users(email),
-        FOREIGN KEY (class_id) REFERENCES classes(id)
-    )
-    """)
+    def executemany(self, *args):
+        self._timed(self._cursor.executemany, *args, query=True)
+        return self
 
-    # ATTENDANCE
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS attendance (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        email TEXT,
-        class_id INTEGER,
-        timestamp INTEGER,
-        FOREIGN KEY (email) REFERENCES users(email),
-        FOREIGN KEY (class_id) REFERENCES classes(id)
-    )
-    """)
+    def fetchone(self):
+        return self._timed(self._cursor.fetchone)
 
-    # OTP
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS otp (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        code TEXT,
-        class_id INTEGER,
-        created_time INTEGER,
-        created_by TEXT,
-        FOREIGN KEY (class_id) REFERENCES classes(id),
-        FOREIGN KEY (created_by) REFERENCES users(email)
-    )
-    """)
+    def fetchall(self):
+        return self._timed(self._cursor.fetchall)
 
-    # Seed schedule for default class only once
-    cur.execute("SELECT id FROM classes WHERE class_code=?", (DEFAULT_CLASS_CODE,))
-    c = cur.fetchone()
-    if c:
-        class_id = c["id"]
-        cur.execute("SELECT COUNT(*) as cnt FROM class_schedule WHERE class_id=?", (class_id,))
-        cnt = cur.fetchone()["cnt"]
-        if cnt == 0:
-            cur.executemany("""
-                INSERT INTO class_schedule (class_id, day, start_time, end_time)
-                VALUES (?, ?, ?, ?)
-            """, [
-                (class_id, "Monday", "09:00", "10:00"),
-                (class_id, "Wednesday", "11:00", "12:00"),
-                (class_id, "Friday", "14:00", "15:00"),
-            ])
+    def fetchmany(self, *args):
+        return self._timed(self._cursor.fetchmany, *args)
 
-    conn.commit()
-    conn.close()
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+class TimedConnection:
+    def __init__(self, conn):
+        self.raw = conn
+        self.queries = 0
+        self.sql_seconds = 0.0
+        # (sql, params) of every execute() when app.config["RECORD_SQL"] is
+        # set; querybench.py replays them
+        self.statements = [] if app.config.get("RECORD_SQL") else None
+
+    def cursor(self):
+        return TimedCursor(self.raw.cursor(), self)
 
-init_db()
+    def execute(self, *args):
+        return self.cursor().execute(*args)
+
+    def executemany(self, *args):
+        return self.cursor().executemany(*args)
+
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            self.raw.commit()
+        finally:
+            self.sql_seconds += time.perf_counter() - start
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@before_render_template.connect_via(app)
+def start_render_timer(sender, **extra):
+    g.render_start = time.perf_counter()
+
+@template_rendered.connect_via(app)
+def stop_render_timer(sender, **extra):
+    start = g.pop("render_start", None)
+    if start is not None:
+        phases = g.setdefault("phases", {})
+        phases["render"] = phases.get("render", 0.0) + time.perf_counter() - start
+
+@app.after_request
+def record_request_metrics(response):
+    # Streamed responses (exports) are measured up to the first byte
+    start = g.get("request_start")
+    if start is None:
+        return response
+    labels = (("endpoint", request.endpoint or "unmatched"),)
+    metrics.observe("cloud_attendance_request_duration_seconds", labels, time.perf_counter() - start)
+    metrics.inc("cloud_attendance_requests_total", labels + (("status", str(response.status_code)),))
+    # The live connection and, in snapshot reporting mode, the snapshot one
+    conns = {id(c): c for c in (g.get("db"), g.get("report_db")) if c is not None}.values()
+    if conns:
+        metrics.observe("cloud_attendance_request_sql_seconds", labels, sum(c.sql_seconds for c in conns))
+        metrics.inc("cloud_attendance_sql_queries_total", labels, sum(c.queries for c in conns))
+    for phase, seconds in g.get("phases", {}).items():
+        metrics.observe(f"cloud_attendance_request_{phase}_seconds", labels, seconds)
+    return response
+
+# ---------------- OTP STORE ----------------
+OTP_GENERATION_SLOTS = 4096
+
+class OTPStore:
+    # Process-local TTL cache of the live OTP per class: (code, created_time, session_id).
+    # The otp table stays the durable copy; this only saves the lookup on submit.
+    # Another worker can replace a class's OTP at any time, so every entry
+    # carries the class's generation, a counter in shared memory that
+    # issue_otp bumps in whichever worker regenerates the code; an entry whose
+    # generation moved on is a miss. Classes share slots modulo
+    # OTP_GENERATION_SLOTS, which only costs the odd extra read.
+    def __init__(self, ttl=OTP_TTL, slots=OTP_GENERATION_SLOTS):
+        self.ttl = ttl
+        self._codes = {}
+        self._lock = threading.Lock()
+        # Created at import: gunicorn's preloaded workers fork after this and
+        # share it. Processes that imported the app themselves do not.
+        self._generations = multiprocessing.Array("q", slots)
+        self._origin_pid = os.getpid()
+
+    def shared(self):
+        # True when every process that can issue OTPs sees our counters: a
+        # worker forked after import, or the only process there is
+        return os.getpid() != self._origin_pid or int(os.environ.get("WEB_CONCURRENCY", "1")) <= 1
+
+    def generation(self, class_id):
+        return self._generations[int(class_id) % len(self._generations)]
+
+    def bump(self, class_id):
+        # Called after a new OTP is committed; entries cached before it miss
+        with self._generations.get_lock():
+            self._generations.get_obj()[int(class_id) % len(self._generations)] += 1
+
+    def put(self, class_id, code, created_time, session_id, generation):
+        # `generation` must be read before the otp row was, so a code
+        # replaced in between is caught on the next get()
+        with self._lock:
+            self._evict(int(time.time()))
+            self._codes[int(class_id)] = (code, created_time, session_id, generation)
+
+    def get(self, class_id):
+        if not self.shared():
+            return None
+        now = int(time.time())
+        with self._lock:
+            entry = self._codes.get(int(class_id))
+            if entry and (now - entry[1] > self.ttl or entry[3] != self.generation(class_id)):
+                del self._codes[int(class_id)]
+                return None
+            return entry[:3] if entry else None
+
+    def __len__(self):
+        return len(self._codes)
+
+    def _evict(self, now):
+        expired = [k for k, entry in self._codes.items() if now - entry[1] > self.ttl]
+        for k in expired:
+            del self._codes[k]
+
+otp_store = OTPStore()
+
+def load_otp(cur, class_id):
+    # Cache miss: read the latest OTP from the otp table and remember it
+    generation = otp_store.generation(class_id)
+    cur.execute("""
+        SELECT code, created_time, session_id FROM otp
+        WHERE class_id=?
+        ORDER BY created_time DESC
+        LIMIT 1
+    """, (class_id,))
+    row = cur.fetchone()
+    if not row:
+        return None
+    otp_store.put(class_id, row["code"], row["created_time"], row["session_id"], generation)
+    return (row["code"], row["created_time"], row["session_id"])
+
+# ---------------- ATTENDANCE WRITER ----------------
+# "full":  like "sync", but the writer commits with synchronous=FULL so an
+#          acknowledged row also survives power loss
+# "sync":  the request waits until the batch holding its row is committed
+#          (many students share one commit; survives a process crash)
+# "async": the request returns as soon as the row is queued; a crash can
+#          lose the rows of the last ATTENDANCE_FLUSH_DELAY window
+ATTENDANCE_DURABILITY = os.environ.get("CLOUD_ATTENDANCE_DURABILITY", "sync")
+ATTENDANCE_BATCH_SIZE = 128
+ATTENDANCE_FLUSH_DELAY = 0.005  # seconds to wait for more rows before committing
+ATTENDANCE_SUBMIT_TIMEOUT = 10
+
+class PendingWrite:
+    def __init__(self, row):
+        self.row = row
+        self.ok = False
+        self.done = threading.Event()
+
+class AttendanceWriter:
+    # Write-behind queue: one background thread per process drains accepted
+    # submissions and inserts them with executemany, one commit per batch.
+    INSERT_SQL = """
+        INSERT INTO attendance (email, class_id, timestamp, session_id) VALUES (?, ?, ?, ?)
+        ON CONFLICT (session_id, email) WHERE session_id IS NOT NULL DO NOTHING
+    """
+
+    def __init__(self, durability=ATTENDANCE_DURABILITY,
+                 batch_size=ATTENDANCE_BATCH_SIZE, flush_delay=ATTENDANCE_FLUSH_DELAY):
+        if durability not in ("full", "sync", "async"):
+            raise ValueError(f"Unknown attendance durability mode: {durability}")
+        self.durability = durability
+        self.batch_size = batch_size
+        self.flush_delay = flush_delay
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def submit(self, email, class_id, ts, session_id=None):
+        # Returns True once the row is committed ("sync") or queued ("async").
+        # A repeat for the same session is a no-op that still returns True.
+        self._ensure_started()
+        pending = PendingWrite((email, class_id, ts, session_id))
+        self._queue.put(pending)
+        if self.durability == "async":
+            return True
+        with metrics.phase("wait"):
+            return pending.done.wait(ATTENDANCE_SUBMIT_TIMEOUT) and pending.ok
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def stop(self):
+        # Drain whatever is still queued, then stop the thread
+        if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+            self._queue.put(None)
+            self._thread.join()
+
+    def _ensure_started(self):
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                # Threads do not survive fork(); each worker process starts its
+                # own writer and must not inherit rows queued by the parent
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = None
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="attendance-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        conn = connect()
+        if self.durability == "full":
+            conn.execute("PRAGMA synchronous=FULL")
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch = [first]
+            deadline = time.monotonic() + self.flush_delay
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._flush(conn, batch)
+        conn.close()
+
+    def _flush(self, conn, batch):
+        sql = self.INSERT_SQL
+        try:
+            conn.executemany(sql, [p.row for p in batch])
+            conn.commit()
+            results = [True] * len(batch)
+        except sqlite3.Error:
+            # One bad row must not fail the whole batch: retry row by row
+            conn.rollback()
+            results = []
+            for p in batch:
+                try:
+                    conn.execute(sql, p.row)
+                    conn.commit()
+                    results.append(True)
+                except sqlite3.Error:
+                    conn.rollback()
+                    app.logger.exception("Attendance insert failed for %s", p.row[0])
+                    results.append(False)
+        for p, ok in zip(batch, results):
+            p.ok = ok
+            p.done.set()
+        attendance_feed.notify()
+
+attendance_writer = AttendanceWriter()
+atexit.register(attendance_writer.stop)
+
+# ---------------- LIVE FEED ----------------
+FEED_POLL_INTERVAL = 1.0    # seconds between checks for rows written by other workers
+FEED_KEEPALIVE = 15         # seconds between SSE comments on a quiet stream
+FEED_MAX_SECONDS = 600      # streams end after this; EventSource reconnects by itself
+# Each open stream holds one of the worker's threads (gunicorn.conf.py reads
+# the same variable) for up to FEED_MAX_SECONDS. FEED_REQUEST_THREADS stay
+# free for everything else, so open class pages never starve /submit_otp on
+# that worker; viewers past the cap poll /live/<id>/poll instead.
+SERVER_THREADS = int(os.environ.get("CLOUD_ATTENDANCE_THREADS", "16"))
+FEED_REQUEST_THREADS = 4
+FEED_MAX_STREAMS = int(os.environ.get("CLOUD_ATTENDANCE_MAX_STREAMS",
+                                      max(1, SERVER_THREADS - FEED_REQUEST_THREADS)))  # per process
+FEED_RETRY_AFTER = 30       # seconds a refused viewer polls before trying a stream again
+FEED_QUEUE_SIZE = 1000
+
+class AttendanceFeed:
+    # In-process fan-out of new attendance rows to live viewers. One thread
+    # per process reads rows newer than the last id it has seen, for the
+    # classes somebody is watching, and copies them to each viewer's queue:
+    # one query per tick however many dashboards are open. The local writer
+    # wakes it after every commit; rows from other workers arrive within
+    # FEED_POLL_INTERVAL.
+    def __init__(self, interval=FEED_POLL_INTERVAL):
+        self.interval = interval
+        self._subscribers = {}  # class_id -> set of queues
+        self._last_id = None
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def subscribe(self, cur, class_id, limit=None):
+        # Subscribe before taking the snapshot: rows committed in between then
+        # show up in both, and the viewer drops deltas it already has.
+        # Returns None when `limit` viewers are already subscribed.
+        sub = queue.Queue(maxsize=FEED_QUEUE_SIZE)
+        with self._lock:
+            if self._pid != os.getpid():
+                self._subscribers, self._thread, self._pid = {}, None, os.getpid()
+            if limit is not None and sum(len(subs) for subs in self._subscribers.values()) >= limit:
+                return None
+            if self._last_id is None or not self._subscribers:
+                self._last_id = cur.execute("SELECT COALESCE(MAX(id), 0) AS id FROM attendance").fetchone()["id"]
+            self._subscribers.setdefault(class_id, set()).add(sub)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="attendance-feed", daemon=True)
+                self._thread.start()
+        return sub
+
+    def unsubscribe(self, class_id, sub):
+        with self._lock:
+            subs = self._subscribers.get(class_id)
+            if subs:
+                subs.discard(sub)
+                if not subs:
+                    del self._subscribers[class_id]
+
+    def viewers(self):
+        with self._lock:
+            return sum(len(subs) for subs in self._subscribers.values())
+
+    def notify(self):
+        self._wake.set()
+
+    def _run(self):
+        conn = connect()
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            with self._lock:
+                class_ids = list(self._subscribers)
+                last_id = self._last_id
+            if not class_ids:
+                continue
+            try:
+                # Bound the read by the newest id first: the cursor then
+                # advances past rows of unwatched classes, and a row committed
+                # between the two reads is left for the next tick, not skipped
+                newest = conn.execute("SELECT COALESCE(MAX(id), 0) AS id FROM attendance").fetchone()["id"]
+                rows = conn.execute(f"""
+                    SELECT a.id, a.email, u.name, a.class_id, a.timestamp
+                    FROM attendance a
+                    LEFT JOIN users u ON u.email = a.email
+                    WHERE a.id > ? AND a.id <= ? AND a.class_id IN ({",".join("?" * len(class_ids))})
+                    ORDER BY a.id
+                """, [last_id, newest] + class_ids).fetchall()
+            except sqlite3.Error:
+                app.logger.exception("Live feed poll failed")
+                continue
+            with self._lock:
+                for r in rows:
+                    for sub in list(self._subscribers.get(r["class_id"], ())):
+                        try:
+                            sub.put_nowait(feed_event(r))
+                        except queue.Full:
+                            # Viewer stopped reading; end its stream
+                            self._subscribers[r["class_id"]].discard(sub)
+                            with sub.mutex:
+                                sub.queue.clear()
+                            sub.put_nowait(None)
+                self._last_id = max(last_id, newest)
+
+def feed_event(row):
+    return {"id": row["id"], "email": row["email"], "name": row["name"] or "-",
+            "time": format_timestamp(row["timestamp"])}
+
+attendance_feed = AttendanceFeed()
+
+# ---------------- READ CACHE ----------------
+READ_CACHE_SIZE = int(os.environ.get("CLOUD_ATTENDANCE_CACHE_SIZE", "1024"))
+READ_CACHE_TTL = 30  # seconds; bounds staleness after writes in another worker process
+
+class ReadCache:
+    # LRU cache for read-mostly lookups (classes, schedules, teacher mappings).
+    # Keys are tuples whose first item is the kind, e.g. ("schedule", 3);
+    # admin write routes call invalidate() for the kinds they touch.
+    # Each kind has a generation that invalidate() bumps; a load that was
+    # already running when its kind was invalidated is returned to its caller
+    # but not stored, so it cannot bring the old value back for a whole TTL.
+    def __init__(self, size=READ_CACHE_SIZE, ttl=READ_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._generations = {}  # kind -> number of invalidations
+        self._epoch = 0  # bumped by clear()
+        self._lock = threading.Lock()
+
+    def get_or_load(self, key, load):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now - entry[1] <= self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            generation = (self._epoch, self._generations.get(key[0], 0))
+        value = load()
+        with self._lock:
+            if (self._epoch, self._generations.get(key[0], 0)) != generation:
+                return value
+            self._entries[key] = (value, now)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def invalidate(self, kind, *key):
+        # invalidate("schedule", 3) drops one entry, invalidate("schedule") all
+        # of them. Either way loads of that kind still running are not stored.
+        with self._lock:
+            self._generations[kind] = self._generations.get(kind, 0) + 1
+            if key:
+                self._entries.pop((kind, *key), None)
+            else:
+                for k in [k for k in self._entries if k[0] == kind]:
+                    del self._entries[k]
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._entries), "capacity": self.size,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+    def __len__(self):
+        return len(self._entries)
+
+read_cache = ReadCache()
+
+SCHEDULE_ORDER_SQL = """
+    CASE day
+      WHEN 'Monday' THEN 1 WHEN 'Tuesday' THEN 2 WHEN 'Wednesday' THEN 3
+      WHEN 'Thursday' THEN 4 WHEN 'Friday' THEN 5 WHEN 'Saturday' THEN 6
+      WHEN 'Sunday' THEN 7 ELSE 8
+    END, start_time
+"""
+
+def cached_classes(cur):
+    # All classes, ordered for dropdowns and listings
+    return read_cache.get_or_load(("classes",), lambda: cur.execute(
+        "SELECT * FROM classes ORDER BY dept, name").fetchall())
+
+def cached_class(cur, class_id):
+    try:
+        class_id = int(class_id)
+    except (TypeError, ValueError):
+        return None
+    return next((c for c in cached_classes(cur) if c["id"] == class_id), None)
+
+def cached_schedule(cur, class_id):
+    return read_cache.get_or_load(("schedule", int(class_id)), lambda: cur.execute(f"""
+        SELECT day, start_time, end_time
+        FROM class_schedule
+        WHERE class_id=?
+        ORDER BY {SCHEDULE_ORDER_SQL}
+    """, (class_id,)).fetchall())
+
+# ---------------- RESPONSE CACHE ----------------
+# Rendered HTML for class-scoped output (a class's timetable card, class
+# dropdowns), keyed by class or by the set of classes shown. Pages built
+# from them get an ETag, so a repeat visit is answered with 304 before any
+# query or template runs. Invalidated by the admin writes that change them.
+FRAGMENT_CACHE_SIZE = int(os.environ.get("CLOUD_ATTENDANCE_FRAGMENT_CACHE_SIZE", "512"))
+
+fragment_cache = ReadCache(size=FRAGMENT_CACHE_SIZE)
+
+def template_stamp():
+    # Changes whenever a template changes, so ETags do not outlive a deploy
+    digest = hashlib.sha1()
+    for root, _, files in sorted(os.walk(os.path.join(BASE_DIR, "templates"))):
+        for name in sorted(files):
+            with open(os.path.join(root, name), "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+TEMPLATE_STAMP = template_stamp()
+
+def cached_fragment(key, template, load_context):
+    # Returns (Markup, etag); load_context() only runs on a miss
+    def render():
+        html = Markup(render_template(template, **load_context()))
+        return html, hashlib.sha1(html.encode()).hexdigest()[:16]
+    return fragment_cache.get_or_load(key, render)
+
+def class_options(cur, class_ids):
+    # <option> list for a class dropdown of `class_ids`
+    ids = tuple(sorted(class_ids))
+    return cached_fragment(("class_options", ids), "fragments/class_options.html",
+                           lambda: {"classes": sorted((c for c in cached_classes(cur) if c["id"] in ids),
+                                                      key=lambda c: c["name"])})[0]
+
+def conditional_page(etag_parts, render):
+    # The page also shows who is logged in, so the ETag covers the session too
+    etag = hashlib.sha1("|".join([TEMPLATE_STAMP, session.get("email", ""), session.get("role", ""),
+                                  *etag_parts]).encode()).hexdigest()
+    # Weak match: compression turns the ETag weak (see compress_response)
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = make_response(render())
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+# ---------------- HTTP CACHING & COMPRESSION ----------------
+# Static files are linked with a content hash (?v=...) and cached by
+# browsers for a year; a deploy that changes a file changes its URL.
+# Rendered pages get an ETag from their body and are answered with 304 when
+# the browser already has them. Text responses above COMPRESS_MIN_SIZE are
+# gzip- (or, if the brotli package is installed, Brotli-) compressed.
+# Streamed responses (exports, live feed) are left alone.
+COMPRESS_MIN_SIZE = int(os.environ.get("CLOUD_ATTENDANCE_COMPRESS_MIN_SIZE", "1024"))  # bytes
+COMPRESS_LEVEL = 6
+COMPRESS_TYPES = {"text/html", "text/css", "text/plain", "text/csv", "text/javascript",
+                  "application/javascript", "application/json", "image/svg+xml"}
+STATIC_MAX_AGE = 365 * 24 * 3600
+
+_static_hashes = {}
+_static_compressed = {}  # (filename, hash, encoding) -> bytes
+
+def static_hash(filename):
+    # Files under static/ only change with a deploy, so each is hashed once
+    digest = _static_hashes.get(filename)
+    if digest is None:
+        try:
+            with open(os.path.join(app.static_folder, filename), "rb") as f:
+                digest = hashlib.sha1(f.read()).hexdigest()[:12]
+        except OSError:
+            digest = ""
+        _static_hashes[filename] = digest
+    return digest
+
+@app.url_defaults
+def hashed_static_url(endpoint, values):
+    if endpoint == "static" and "filename" in values and "v" not in values:
+        values["v"] = static_hash(values["filename"])
+
+def compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=5)
+    return gzip.compress(data, compresslevel=COMPRESS_LEVEL, mtime=0)
+
+def accepted_encoding():
+    if brotli is not None and request.accept_encodings["br"]:
+        return "br"
+    if request.accept_encodings["gzip"]:
+        return "gzip"
+    return None
+
+@app.after_request
+def finish_response(response):
+    if request.method not in ("GET", "HEAD") or response.status_code != 200:
+        return response
+    # send_file responses count as streamed; other streamed ones are left alone
+    if request.endpoint == "static":
+        filename = request.view_args["filename"]
+        digest = static_hash(filename)
+        if digest and request.args.get("v") == digest:
+            response.headers["Cache-Control"] = f"public, max-age={STATIC_MAX_AGE}, immutable"
+        compress_response(response, (filename, digest))
+        return response
+    if response.is_streamed:
+        return response
+    if response.mimetype == "text/html" and not response.get_etag()[0]:
+        response.add_etag()
+        response.headers.setdefault("Cache-Control", "private, no-cache")
+        response.make_conditional(request)
+        if response.status_code != 200:
+            return response
+    compress_response(response)
+    return response
+
+def compress_response(response, static_key=None):
+    if response.mimetype not in COMPRESS_TYPES or "Content-Encoding" in response.headers:
+        return
+    response.vary.add("Accept-Encoding")
+    encoding = accepted_encoding()
+    if encoding is None:
+        return
+    key = static_key and (*static_key, encoding)
+    body = _static_compressed.get(key) if key else None
+    if body is None:
+        response.direct_passthrough = False  # static files arrive as a file wrapper
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return
+        body = compress(data, encoding)
+        if key:
+            _static_compressed[key] = body
+    response.set_data(body)
+    response.headers["Content-Encoding"] = encoding
+    # The compressed bytes differ from the identity ones, so the validator
+    # can only be weak from here on
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
 
 # ---------------- HELPERS ----------------
 def login_required(role=None):
@@ -155,8 +978,372 @@ def login_required(role=None):
         return wrapper
     return decorator
 
+# ---------------- SESSION CLAIMS ----------------
+# A student's class and a teacher's assigned classes are resolved at login and
+# kept in the signed session cookie together with the claims_version they were
+# read under. Admin mapping changes bump the version; a session holding an
+# older one re-reads its claims on the next request instead of on every one.
+# The version itself is read once per request, never from a cache: a teacher
+# removed in another worker must lose access on their next request.
+def claims_version():
+    if "claims_version" not in g:
+        g.claims_version = get_db().execute(
+            "SELECT value FROM app_state WHERE key='claims_version'").fetchone()["value"]
+    return g.claims_version
+
+def bump_claims_version(cur):
+    # Call inside the transaction that changes the mapping
+    cur.execute("UPDATE app_state SET value = value + 1 WHERE key='claims_version'")
+
+def load_claims(email, role):
+    cur = get_db().cursor()
+    if role == "student":
+        cur.execute("SELECT class_id FROM student_profile WHERE email=?", (email,))
+        row = cur.fetchone()
+        return {"class_id": row["class_id"] if row else None}
+    if role == "teacher":
+        cur.execute("SELECT class_id FROM teacher_class WHERE email=?", (email,))
+        return {"class_ids": sorted(r["class_id"] for r in cur.fetchall())}
+    return {}
+
+def store_claims():
+    session["claims_v"] = claims_version()
+    session["claims"] = load_claims(session["email"], session["role"])
+
+def claims():
+    if session.get("claims_v") != claims_version() or "claims" not in session:
+        store_claims()
+    return session["claims"]
+
+def student_class_id():
+    return claims().get("class_id")
+
+def teacher_class_ids():
+    return set(claims().get("class_ids", ()))
+
+def teacher_classes(cur):
+    # The teacher's classes, built from the cached class list
+    ids = teacher_class_ids()
+    return sorted((c for c in cached_classes(cur) if c["id"] in ids), key=lambda c: c["name"])
+
+# ---------------- RATE LIMITS ----------------
+# In-memory token buckets, checked before a route touches the database.
+# "capacity/seconds": up to `capacity` requests at once, refilled evenly over
+# `seconds`. OTP attempts are limited per student, per IP and per class, and
+# logins per email and per IP. A whole lecture hall logs in and submits
+# within seconds, often from one NAT address, so the IP and class buckets
+# are generous. Override any of them, or switch one off with 0:
+#   CLOUD_ATTENDANCE_RATE_LIMITS="submit_otp.user=5/60,login.ip=0/60"
+RATE_LIMITS = {
+    "submit_otp": {"user": "5/60", "ip": "600/60", "class": "1200/60"},
+    "login": {"user": "10/300", "ip": "600/60"},
+}
+RATE_LIMIT_KEYS = 100000  # buckets kept per process; the least recently used go first
+
+def parse_rate_limits(defaults, spec):
+    limits = {route: dict(scopes) for route, scopes in defaults.items()}
+    for item in filter(None, (spec or "").split(",")):
+        try:
+            name, rate = item.strip().split("=")
+            route, scope = name.split(".")
+        except ValueError:
+            raise ValueError(f"Bad rate limit {item!r}, expected route.scope=capacity/seconds")
+        limits.setdefault(route, {})[scope] = rate
+    parsed = {}
+    for route, scopes in limits.items():
+        for scope, rate in scopes.items():
+            try:
+                capacity, seconds = (float(x) for x in rate.split("/"))
+            except ValueError:
+                capacity = seconds = None
+            if capacity is None or capacity < 0 or not seconds > 0:
+                raise ValueError(f"Bad rate limit {route}.{scope}={rate}, expected capacity >= 0 "
+                                 "and seconds > 0 (capacity/seconds)")
+            if capacity > 0:
+                parsed.setdefault(route, {})[scope] = (capacity, capacity / seconds)
+    return parsed
+
+class RateLimiter:
+    def __init__(self, limits, max_keys=RATE_LIMIT_KEYS):
+        self.limits = limits
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # (route, scope, key) -> [tokens, last refill]
+        self._lock = threading.Lock()
+
+    def check(self, route, keys):
+        # keys: {scope: key}. Takes one token from every bucket, or none if any
+        # is empty; returns (rejected scope, seconds until a token) or None.
+        limits = self.limits.get(route, {})
+        now = time.monotonic()
+        with self._lock:
+            buckets = []
+            for scope, key in keys.items():
+                if scope not in limits or key is None:
+                    continue
+                capacity, rate = limits[scope]
+                bucket = self._buckets.get((route, scope, key))
+                if bucket is None:
+                    bucket = self._buckets[(route, scope, key)] = [capacity, now]
+                else:
+                    self._buckets.move_to_end((route, scope, key))
+                    bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+                    bucket[1] = now
+                if bucket[0] < 1:
+                    return scope, (1 - bucket[0]) / rate
+                buckets.append(bucket)
+            for bucket in buckets:
+                bucket[0] -= 1
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return None
+
+    def __len__(self):
+        return len(self._buckets)
+
+rate_limiter = RateLimiter(parse_rate_limits(RATE_LIMITS, os.environ.get("CLOUD_ATTENDANCE_RATE_LIMITS")))
+
+def rate_limited(route, keys):
+    # keys() builds the {scope: key} dict from the request alone (form, session
+    # cookie, client address), so rejected requests cost no queries
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if request.method == "POST":
+                rejected = rate_limiter.check(route, keys())
+                if rejected:
+                    scope, retry_after = rejected
+                    metrics.inc("cloud_attendance_rate_limited_total", (("route", route), ("scope", scope)))
+                    retry_after = max(1, math.ceil(retry_after))
+                    headers = {"Retry-After": str(retry_after)}
+                    if request.path.startswith("/api/"):
+                        return jsonify(error="rate_limited", retry_after=retry_after), 429, headers
+                    return "Too many attempts, try again shortly", 429, headers
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def otp_rate_keys():
+    return {"user": session.get("email"), "ip": request.remote_addr,
+            "class": session.get("claims", {}).get("class_id")}
+
+def login_rate_keys():
+    return {"user": (request.form.get("email") or "").strip().lower() or None, "ip": request.remote_addr}
+
+# ---------------- PAGINATION ----------------
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+def page_size():
+    try:
+        size = int(request.args.get("limit", PAGE_SIZE))
+    except ValueError:
+        size = PAGE_SIZE
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+def parse_cursor(value):
+    # Cursors are "<timestamp>:<id>" of the last row on the previous page
+    try:
+        ts, row_id = (value or "").split(":")
+        return int(ts), int(row_id)
+    except ValueError:
+        return None
+
+def parse_day(value, end=False):
+    # "YYYY-MM-DD" -> epoch seconds at local midnight (the next one for `end`)
+    try:
+        day = datetime.strptime(value or "", "%Y-%m-%d")
+    except ValueError:
+        return None
+    return int(day.timestamp()) + (86400 if end else 0)
+
+def attendance_filters(args, where, params):
+    # Shared filters: ?class_id=&email=&from=YYYY-MM-DD&to=YYYY-MM-DD
+    if args.get("class_id", "").isdigit():
+        where.append("a.class_id=?"); params.append(int(args["class_id"]))
+    if args.get("email"):
+        where.append("a.email=?"); params.append(args["email"].strip().lower())
+    start = parse_day(args.get("from"))
+    if start is not None:
+        where.append("a.timestamp>=?"); params.append(start)
+    end = parse_day(args.get("to"), end=True)
+    if end is not None:
+        where.append("a.timestamp<?"); params.append(end)
+
+def fetch_attendance_page(cur, select_sql, where, params, time_range=(None, None)):
+    # Keyset pagination on (timestamp, id): every page is an index range scan
+    # that starts after the previous page's last row, so page N costs the
+    # same as page 1 regardless of how much history there is.
+    # select_sql reads from "{attendance} a"; the current term is queried
+    # first and archived terms are attached only when the page reaches them.
+    where, params = list(where), list(params)
+    lo, hi = time_range
+    cursor = parse_cursor(request.args.get("before"))
+    if cursor:
+        where.append("(a.timestamp, a.id) < (?, ?)"); params.extend(cursor)
+        hi = cursor[0] + 1 if hi is None else min(hi, cursor[0] + 1)
+    limit = page_size()
+    sql = select_sql
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY a.timestamp DESC, a.id DESC LIMIT ?"
+    cur.execute(sql.format(attendance="main.attendance"), params + [limit + 1])
+    rows = cur.fetchall()
+    for archive in reversed(archives_in_range(cur, lo, hi)):
+        # Terms don't overlap: once the page is full and this archive ends
+        # before the oldest row we have, nothing older can belong on it
+        if len(rows) > limit and archive["end_ts"] < rows[limit]["timestamp"]:
+            break
+        with attached_archive(cur, archive) as alias:
+            cur.execute(sql.format(attendance=f"{alias}.attendance"), params + [limit + 1])
+            rows += cur.fetchall()
+        rows.sort(key=lambda r: (r["timestamp"], r["id"]), reverse=True)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = f"{rows[-1]['timestamp']}:{rows[-1]['id']}"
+    return rows, next_cursor
+
+def filter_range(args):
+    # (from, to) of the date filters as epoch seconds, for partition pruning
+    return parse_day(args.get("from")), parse_day(args.get("to"), end=True)
+
+def page_url(**changes):
+    # Current URL with some query args replaced (None drops the arg)
+    args = request.args.to_dict()
+    args.update(changes)
+    args = {k: v for k, v in args.items() if v not in (None, "")}
+    return request.path + ("?" + urlencode(args) if args else "")
+
+@app.template_filter("datetime")
+def format_timestamp(ts):
+    return datetime.fromtimestamp(ts).strftime("%d-%b-%Y %I:%M %p")
+
+# ---------------- ATTENDANCE ARCHIVE ----------------
+# `attendance` holds the current term only. Closed terms are moved by
+# `flask --app app archive-term` into read-only files under ARCHIVE_DIR
+# (one attendance table each, same columns and indexes), registered in
+# attendance_archive. History and export queries attach the files they need
+# for the duration of one query. Daily rollups stay in the main database.
+def archive_path(archive):
+    return os.path.join(ARCHIVE_DIR, archive["file"])
+
+def list_archives(cur):
+    return read_cache.get_or_load(("archives",), lambda: cur.execute(
+        "SELECT * FROM attendance_archive ORDER BY start_ts").fetchall())
+
+def archives_in_range(cur, lo=None, hi=None):
+    # Archives holding rows in [lo, hi), oldest first
+    return [a for a in list_archives(cur)
+            if (hi is None or a["start_ts"] < hi) and (lo is None or a["end_ts"] >= lo)]
+
+@contextmanager
+def attached_archive(cur, archive):
+    alias = f"archive_{archive['id']}"
+    uri = "file:" + urllib.parse.quote(archive_path(archive)) + "?mode=ro"
+    cur.execute(f"ATTACH DATABASE ? AS {alias}", (uri,))
+    try:
+        yield alias
+    finally:
+        cur.execute(f"DETACH DATABASE {alias}")
+
+def archive_term(conn, name, before_ts, vacuum=False):
+    # Moves every attendance row older than before_ts into a new archive file.
+    # Step 1 fills the archive in its own transaction; step 2 deletes exactly
+    # the archived ids from the main database and registers the file. A crash
+    # between the two leaves an unregistered file, which the next run replaces.
+    conn.isolation_level = None
+    if conn.execute("SELECT 1 FROM attendance_archive WHERE name=?", (name,)).fetchone():
+        raise ValueError(f"Term {name} is already archived")
+    last = conn.execute("SELECT MAX(end_ts) AS end_ts FROM attendance_archive").fetchone()["end_ts"]
+    if last is not None and before_ts <= last:
+        raise ValueError("Cutoff must be after the last archived term")
+    span = conn.execute("""
+        SELECT MIN(timestamp) AS start_ts, MAX(timestamp) AS end_ts, COUNT(*) AS n
+        FROM attendance WHERE timestamp < ?
+    """, (before_ts,)).fetchone()
+    if not span["n"]:
+        return 0
+
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    filename = f"attendance-{name}.db"
+    path = os.path.join(ARCHIVE_DIR, filename)
+    if os.path.exists(path):
+        os.chmod(path, 0o644)
+        os.remove(path)
+    archive = sqlite3.connect(path)
+    archive.executescript("""
+        PRAGMA journal_mode=DELETE;
+        PRAGMA synchronous=FULL;
+        CREATE TABLE attendance (
+            id INTEGER PRIMARY KEY,
+            email TEXT,
+            class_id INTEGER,
+            timestamp INTEGER,
+            session_id INTEGER
+        );
+    """)
+    archive.close()
+
+    conn.execute("ATTACH DATABASE ? AS new_archive", (path,))
+    try:
+        conn.execute("BEGIN")
+        conn.execute("""
+            INSERT INTO new_archive.attendance (id, email, class_id, timestamp, session_id)
+            SELECT id, email, class_id, timestamp, session_id FROM main.attendance WHERE timestamp < ?
+        """, (before_ts,))
+        conn.execute("COMMIT")
+        # Same indexes as the hot table, built once after the bulk copy
+        conn.execute("CREATE INDEX new_archive.idx_attendance_email_ts_id ON attendance (email, timestamp, id, class_id)")
+        conn.execute("CREATE INDEX new_archive.idx_attendance_ts ON attendance (timestamp)")
+        conn.execute("CREATE INDEX new_archive.idx_attendance_class_ts ON attendance (class_id, timestamp)")
+        conn.execute("ANALYZE new_archive")
+        count = conn.execute("SELECT COUNT(*) AS n FROM new_archive.attendance").fetchone()["n"]
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            deleted = conn.execute("""
+                DELETE FROM main.attendance
+                WHERE timestamp < ? AND id IN (SELECT id FROM new_archive.attendance)
+            """, (before_ts,)).rowcount
+            if deleted != count:
+                raise RuntimeError(f"archived {count} rows but deleted {deleted}")
+            conn.execute("""
+                INSERT INTO attendance_archive (name, file, start_ts, end_ts, row_count, archived_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (name, filename, span["start_ts"], span["end_ts"], count, int(time.time())))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.execute("DETACH DATABASE new_archive")
+    os.chmod(path, 0o444)
+    read_cache.invalidate("archives")
+    if vacuum:
+        conn.execute("VACUUM")
+    return count
+
+@app.cli.command("archive-term")
+@click.option("--name", required=True, help="Term name, e.g. 2026-spring")
+@click.option("--before", "before", required=True, help="Archive rows before this date (YYYY-MM-DD)")
+@click.option("--vacuum", is_flag=True, help="Shrink database.db afterwards")
+def archive_term_command(name, before, vacuum):
+    """Move attendance older than --before into a read-only archive file."""
+    before_ts = parse_day(before)
+    if before_ts is None or before_ts > time.time():
+        raise click.BadParameter("must be a past date in YYYY-MM-DD form", param_hint="--before")
+    conn = connect()
+    try:
+        count = archive_term(conn, name, before_ts, vacuum=vacuum)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    finally:
+        conn.close()
+    print(f"archived {count} rows as {name}" if count else "nothing to archive")
+
 # ---------------- LOGIN ----------------
 @app.route("/", methods=["GET", "POST"])
+@rate_limited("login", login_rate_keys)
 def login():
     if request.method == "POST":
         email = request.form["email"].strip().lower()
@@ -170,11 +1357,11 @@ def login():
             (email, password, role)
         )
         user = cur.fetchone()
-        conn.close()
 
         if user:
             session["email"] = user["email"]
             session["role"] = user["role"]
+            store_claims()
             return redirect(f"/{role}")
 
         return render_template("login.html", error="Invalid credentials",
@@ -200,7 +1387,6 @@ def register():
 
         cur.execute("SELECT email FROM users WHERE email=?", (email,))
         if cur.fetchone():
-            conn.close()
             return render_template("register.html", error="User exists",
                                    title="Register", header="Create Account", subheader="Join Cloud Attendance")
 
@@ -211,14 +1397,14 @@ def register():
 
         if role == "student":
             if not class_code:
-                conn.rollback(); conn.close()
+                conn.rollback()
                 return render_template("register.html", error="Class code required for students",
                                        title="Register", header="Create Account", subheader="Join Cloud Attendance")
 
             cur.execute("SELECT id FROM classes WHERE class_code=?", (class_code,))
             class_row = cur.fetchone()
             if not class_row:
-                conn.rollback(); conn.close()
+                conn.rollback()
                 return render_template("register.html", error="Invalid class code",
                                        title="Register", header="Create Account", subheader="Join Cloud Attendance")
 
@@ -227,7 +1413,7 @@ def register():
 
         if role == "teacher":
             if not dept:
-                conn.rollback(); conn.close()
+                conn.rollback()
                 return render_template("register.html", error="Department required for teachers",
                                        title="Register", header="Create Account", subheader="Join Cloud Attendance")
 
@@ -241,7 +1427,6 @@ def register():
             """, (email, DEFAULT_CLASS_CODE))
 
         conn.commit()
-        conn.close()
         return redirect("/")
 
     return render_template("register.html",
@@ -251,31 +1436,313 @@ def register():
 @app.route("/admin")
 @login_required("admin")
 def admin_dashboard():
-    conn = get_db()
-    cur = conn.cursor()
+    cur = get_report_db().cursor()
 
-    cur.execute("""
-        SELECT a.email, u.name as student_name, c.name as class_name, c.class_code, a.timestamp
-        FROM attendance a
+    where, params = [], []
+    attendance_filters(request.args, where, params)
+    rows, next_cursor = fetch_attendance_page(cur, """
+        SELECT a.id, a.email, u.name as student_name, c.name as class_name, c.class_code, a.timestamp
+        FROM {attendance} a
         LEFT JOIN users u ON u.email = a.email
         LEFT JOIN classes c ON c.id = a.class_id
-        ORDER BY a.timestamp DESC
-        LIMIT 200
-    """)
-    rows = cur.fetchall()
-    conn.close()
+    """, where, params, filter_range(request.args))
+
+    # Class lists come from the live database so the shared cache never
+    # holds snapshot data
+    classes = cached_classes(get_db().cursor())
 
     records = [{
         "email": r["email"],
         "student_name": r["student_name"] or "-",
         "class_name": r["class_name"] or "-",
         "class_code": r["class_code"] or "-",
-        "time": datetime.fromtimestamp(r["timestamp"]).strftime("%d-%b-%Y %I:%M %p")
+        "time": format_timestamp(r["timestamp"])
     } for r in rows]
 
-    return render_template("admin.html", records=records,
+    return render_template("admin.html", records=records, classes=classes, filters=request.args,
+                           next_url=page_url(before=next_cursor) if next_cursor else None,
+                           first_url=page_url(before=None) if request.args.get("before") else None,
+                           export_args=urlencode({k: v for k, v in request.args.items()
+                                                  if k in ("class_id", "email", "from", "to") and v}),
                            title="Admin", header="Admin Dashboard", subheader="Monitor attendance activity")
 
+# ---------------- ADMIN: EXPORT ----------------
+EXPORT_CHUNK = 1000
+EXPORT_COLUMNS = ["id", "email", "student_name", "class_id", "class_name", "class_code", "dept", "timestamp", "time"]
+
+@app.route("/admin/export")
+@login_required("admin")
+def admin_export():
+    # Streams the whole (filtered) attendance log; rows are pulled from the
+    # cursor in chunks, so memory stays flat however large the export is.
+    fmt = request.args.get("format", "csv")
+    if fmt not in ("csv", "ndjson"):
+        return "Unknown export format", 400
+
+    where, params = [], []
+    attendance_filters(request.args, where, params)
+    if request.args.get("dept"):
+        where.append("c.dept=?"); params.append(request.args["dept"].strip())
+
+    sql = """
+        SELECT a.id, a.email, u.name as student_name, a.class_id, c.name as class_name,
+               c.class_code, c.dept, a.timestamp
+        FROM {attendance} a
+        LEFT JOIN users u ON u.email = a.email
+        LEFT JOIN classes c ON c.id = a.class_id
+    """
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY a.timestamp, a.id"
+    lo, hi = filter_range(request.args)
+
+    def generate():
+        cur = get_report_db().cursor()
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        if fmt == "csv":
+            writer.writerow(EXPORT_COLUMNS)
+
+        def stream(table):
+            cur.execute(sql.format(attendance=table), params)
+            while True:
+                rows = cur.fetchmany(EXPORT_CHUNK)
+                if not rows:
+                    break
+                for r in rows:
+                    record = dict(r)
+                    record["time"] = datetime.fromtimestamp(r["timestamp"]).isoformat()
+                    if fmt == "csv":
+                        writer.writerow([record[k] for k in EXPORT_COLUMNS])
+                    else:
+                        buf.write(json.dumps(record) + "\n")
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+
+        # Archived terms oldest first, then the current term
+        for archive in archives_in_range(cur, lo, hi):
+            with attached_archive(cur, archive) as alias:
+                yield from stream(f"{alias}.attendance")
+        yield from stream("main.attendance")
+        yield buf.getvalue()
+
+    mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    filename = f"attendance-{datetime.now():%Y%m%d-%H%M%S}.{fmt}"
+    return Response(stream_with_context(generate()), mimetype=mimetype,
+                    headers={"Content-Disposition": f"attachment; filename={filename}"})
+
+# ---------------- ADMIN: REPORTS ----------------
+DAY_NAMES = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+DEFAULT_THRESHOLD = 75
+
+def weekday_counts(start, end):
+    # How often each weekday (Monday=0) occurs between two dates, inclusive
+    counts = [0] * 7
+    days = (end - start).days + 1
+    for i in range(7):
+        counts[(start.weekday() + i) % 7] = max(0, (days - i + 6) // 7)
+    return counts
+
+def report_range(cur):
+    # ?from=&to= (YYYY-MM-DD); defaults to first recorded day .. today
+    today = date.today()
+    try:
+        end = date.fromisoformat(request.args.get("to") or today.isoformat())
+    except ValueError:
+        end = today
+    try:
+        start = date.fromisoformat(request.args["from"])
+    except (KeyError, ValueError):
+        cur.execute("SELECT MIN(day) AS first FROM class_daily")
+        first = cur.fetchone()["first"]
+        start = date.fromisoformat(first) if first else end
+    return start, max(start, end)
+
+def schedule_weekdays(cur, class_id=None):
+    # {class_id: {weekday, ...}} from class_schedule
+    sql = "SELECT DISTINCT class_id, day FROM class_schedule"
+    cur.execute(sql + (" WHERE class_id=?" if class_id else ""), (class_id,) if class_id else ())
+    weekdays = {}
+    for r in cur.fetchall():
+        if r["day"] in DAY_NAMES:
+            weekdays.setdefault(r["class_id"], set()).add(DAY_NAMES.index(r["day"]))
+    return weekdays
+
+def percent(present, total):
+    return round(100.0 * present / total, 1) if total else None
+
+# SQLite's %w counts from Sunday=0; this maps it to Python's Monday=0
+WEEKDAY_SQL = "(CAST(strftime('%w', day) AS INTEGER) + 6) % 7"
+
+@app.route("/admin/reports")
+@login_required("admin")
+def admin_reports():
+    # Percentages come from the daily rollups: a student counts as present
+    # on a scheduled day if they marked attendance for that class that day.
+    cur = get_report_db().cursor()
+
+    start, end = report_range(cur)
+    try:
+        threshold = float(request.args.get("threshold", DEFAULT_THRESHOLD))
+    except ValueError:
+        threshold = DEFAULT_THRESHOLD
+    counts = weekday_counts(start, end)
+    weekdays = schedule_weekdays(cur)
+
+    cur.execute("SELECT class_id, COUNT(*) AS n FROM student_profile GROUP BY class_id")
+    enrolled = {r["class_id"]: r["n"] for r in cur.fetchall()}
+
+    # Attendance sessions actually opened (one per generated OTP)
+    cur.execute("""
+        SELECT class_id, COUNT(*) AS n FROM attendance_session
+        WHERE started_at >= ? AND started_at < ?
+        GROUP BY class_id
+    """, (parse_day(start.isoformat()), parse_day(end.isoformat(), end=True)))
+    held = {r["class_id"]: r["n"] for r in cur.fetchall()}
+
+    cur.execute(f"""
+        SELECT class_id, {WEEKDAY_SQL} AS wd, SUM(present) AS present
+        FROM class_daily
+        WHERE day BETWEEN ? AND ?
+        GROUP BY class_id, wd
+    """, (start.isoformat(), end.isoformat()))
+    present = {}
+    for r in cur.fetchall():
+        if r["wd"] in weekdays.get(r["class_id"], ()):
+            present[r["class_id"]] = present.get(r["class_id"], 0) + r["present"]
+
+    classes = []
+    for c in cached_classes(get_db().cursor()):
+        sessions = sum(counts[wd] for wd in weekdays.get(c["id"], ()))
+        classes.append({
+            "id": c["id"], "name": c["name"], "dept": c["dept"], "class_code": c["class_code"],
+            "enrolled": enrolled.get(c["id"], 0), "sessions": sessions, "held": held.get(c["id"], 0),
+            "percent": percent(present.get(c["id"], 0), sessions * enrolled.get(c["id"], 0)),
+        })
+
+    selected = None
+    students = []
+    class_id = request.args.get("class_id", "")
+    if class_id.isdigit():
+        selected = next((c for c in classes if c["id"] == int(class_id)), None)
+    if selected:
+        scheduled = weekdays.get(selected["id"], set())
+        cur.execute(f"""
+            SELECT email, {WEEKDAY_SQL} AS wd, COUNT(*) AS days
+            FROM attendance_daily
+            WHERE class_id=? AND day BETWEEN ? AND ?
+            GROUP BY email, wd
+        """, (selected["id"], start.isoformat(), end.isoformat()))
+        days_present = {}
+        for r in cur.fetchall():
+            if r["wd"] in scheduled:
+                days_present[r["email"]] = days_present.get(r["email"], 0) + r["days"]
+
+        cur.execute("""
+            SELECT u.name, u.email
+            FROM student_profile sp
+            JOIN users u ON u.email = sp.email
+            WHERE sp.class_id=?
+            ORDER BY u.name
+        """, (selected["id"],))
+        for r in cur.fetchall():
+            pct = percent(days_present.get(r["email"], 0), selected["sessions"])
+            students.append({
+                "name": r["name"], "email": r["email"],
+                "present": days_present.get(r["email"], 0), "percent": pct,
+                "below": pct is not None and pct < threshold,
+            })
+        if request.args.get("below"):
+            students = [st for st in students if st["below"]]
+
+    return render_template("admin_reports.html",
+                           classes=classes, selected=selected, students=students,
+                           start=start, end=end, threshold=threshold, below=bool(request.args.get("below")),
+                           title="Admin", header="Attendance Reports", subheader="Attendance percentage against the timetable")
+
+def rebuild_rollups(conn):
+    # Archived terms count too; their files are attached before the transaction
+    sources = ["main.attendance"]
+    attached = []
+    try:
+        for archive in list_archives(conn.cursor()):
+            uri = "file:" + urllib.parse.quote(archive_path(archive)) + "?mode=ro"
+            conn.execute(f"ATTACH DATABASE ? AS archive_{archive['id']}", (uri,))
+            attached.append(f"archive_{archive['id']}")
+            sources.append(f"archive_{archive['id']}.attendance")
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("DELETE FROM attendance_daily")
+        conn.execute("DELETE FROM class_daily")
+        # class_daily is filled by the trigger on attendance_daily
+        conn.execute(f"""
+            INSERT INTO attendance_daily (email, class_id, day, marks)
+            SELECT email, class_id, date(timestamp, 'unixepoch', 'localtime'), COUNT(*)
+            FROM ({" UNION ALL ".join(f"SELECT email, class_id, timestamp FROM {t}" for t in sources)})
+            GROUP BY 1, 2, 3
+        """)
+        conn.commit()
+    except Exception:
+        # DETACH fails inside an open transaction, which would hide this error
+        conn.rollback()
+        raise
+    finally:
+        for name in attached:
+            conn.execute(f"DETACH DATABASE {name}")
+
+@app.cli.command("rebuild-rollups")
+def rebuild_rollups_command():
+    """Recompute attendance_daily and class_daily from the attendance table."""
+    conn = connect()
+    rebuild_rollups(conn)
+    count = conn.execute("SELECT COUNT(*) FROM attendance_daily").fetchone()[0]
+    conn.close()
+    print(f"rebuilt rollups: {count} student-days")
+
+# ---------------- ADMIN: ANALYTICS ----------------
+# numpy is only needed here, so analytics.py is imported on first use
+analytics_cache = None
+
+@app.route("/admin/analytics")
+@login_required("admin")
+def admin_analytics():
+    # Heatmap, per-class rates and weekly trend over the current term's
+    # attendance, computed column-wise in analytics.py and cached until a
+    # new check-in arrives. Archived terms are left to /admin/reports.
+    global analytics_cache
+    import analytics
+    if analytics_cache is None:
+        analytics_cache = analytics.AnalyticsCache()
+
+    conn = get_report_db()
+    cur = conn.cursor()
+    start, end = report_range(cur)
+    if "from" not in request.args:
+        cur.execute("SELECT MIN(timestamp) AS first FROM attendance")
+        first = cur.fetchone()["first"]
+        if first:
+            start = min(datetime.fromtimestamp(first).date(), end)
+
+    def load_inputs():
+        counts = weekday_counts(start, end)
+        weekdays = schedule_weekdays(cur)
+        cur.execute("SELECT class_id, COUNT(*) AS n FROM student_profile GROUP BY class_id")
+        enrolled = {r["class_id"]: r["n"] for r in cur.fetchall()}
+        sessions = {cid: sum(counts[wd] for wd in wds) for cid, wds in weekdays.items()}
+        return weekdays, enrolled, sessions
+
+    result = analytics_cache.get(conn, start, end, load_inputs)
+    rates = result["classes"]
+    classes = [dict(c, **rates.get(c["id"], {"present": 0, "expected": 0, "percent": None}))
+               for c in cached_classes(get_db().cursor())]
+    peak = max(max(row) for row in result["heatmap"]) or 1
+    busiest = max((w["checkins"] for w in result["weeks"]), default=0) or 1
+
+    return render_template("admin_analytics.html",
+                           result=result, classes=classes, day_names=DAY_NAMES, peak=peak, busiest=busiest,
+                           start=start, end=end,
+                           title="Admin", header="Attendance Analytics", subheader="Check-in patterns over the term")
+
 # ---------------- ADMIN: CLASSES ----------------
 @app.route("/admin/classes", methods=["GET", "POST"])
 @login_required("admin")
@@ -294,24 +1761,19 @@ def admin_classes():
                 (name, dept, class_code)
             )
             conn.commit()
+            read_cache.invalidate("classes")
+            fragment_cache.invalidate("class_options")
         except sqlite3.IntegrityError:
-            cur.execute("SELECT * FROM classes ORDER BY dept, name")
-            classes = cur.fetchall()
-            conn.close()
             return render_template(
                 "admin_classes.html",
-                classes=classes,
+                classes=cached_classes(cur),
                 error="Class code already exists!",
                 title="Admin", header="Manage Classes", subheader="Create classes and manage schedule"
             )
 
-    cur.execute("SELECT * FROM classes ORDER BY dept, name")
-    classes = cur.fetchall()
-    conn.close()
-
     return render_template(
         "admin_classes.html",
-        classes=classes,
+        classes=cached_classes(cur),
         title="Admin", header="Manage Classes", subheader="Create classes and manage schedule"
     )
 
@@ -322,10 +1784,8 @@ def admin_schedule(class_id):
     conn = get_db()
     cur = conn.cursor()
 
-    cur.execute("SELECT * FROM classes WHERE id=?", (class_id,))
-    c = cur.fetchone()
+    c = cached_class(cur, class_id)
     if not c:
-        conn.close()
         return "Class not found", 404
 
     if request.method == "POST":
@@ -338,21 +1798,11 @@ def admin_schedule(class_id):
             VALUES (?, ?, ?, ?)
         """, (class_id, day, start_time, end_time))
         conn.commit()
+        read_cache.invalidate("schedule", class_id)
+        fragment_cache.invalidate("schedule_card", class_id)
 
-    cur.execute("""
-        SELECT day, start_time, end_time
-        FROM class_schedule
-        WHERE class_id=?
-        ORDER BY
-          CASE day
-            WHEN 'Monday' THEN 1 WHEN 'Tuesday' THEN 2 WHEN 'Wednesday' THEN 3
-            WHEN 'Thursday' THEN 4 WHEN 'Friday' THEN 5 WHEN 'Saturday' THEN 6
-            WHEN 'Sunday' THEN 7 ELSE 8
-          END, start_time
-    """, (class_id,))
-    schedule = cur.fetchall()
+    schedule = cached_schedule(cur, class_id)
 
-    conn.close()
     return render_template(
         "admin_schedule.html",
         c=c, schedule=schedule,
@@ -363,76 +1813,195 @@ def admin_schedule(class_id):
 @app.route("/admin/teachers", methods=["GET", "POST"])
 @login_required("admin")
 def admin_teachers():
+    # Teacher and class fields are typeahead inputs backed by /api/search/*;
+    # the page itself only renders the first few teachers.
     conn = get_db()
     cur = conn.cursor()
+    error = None
 
     if request.method == "POST":
         teacher_email = request.form["teacher_email"].strip().lower()
-        class_id = request.form["class_id"].strip()
+        class_code = request.form.get("class_code", "").strip().upper()
+        class_id = request.form.get("class_id", "").strip()
+
+        if class_code:
+            cur.execute("SELECT id FROM classes WHERE class_code=?", (class_code,))
+        else:
+            cur.execute("SELECT id FROM classes WHERE id=?", (class_id,))
+        class_row = cur.fetchone()
 
         cur.execute("SELECT email FROM users WHERE email=? AND role='teacher'", (teacher_email,))
         if not cur.fetchone():
-            cur.execute("SELECT * FROM classes ORDER BY dept, name")
-            classes = cur.fetchall()
+            error = "Teacher not found. Register teacher first."
+        elif not class_row:
+            error = "Class not found."
+        else:
             cur.execute("""
-                SELECT u.name, u.email, tp.dept
-                FROM users u
-                LEFT JOIN teacher_profile tp ON tp.email=u.email
-                WHERE u.role='teacher'
-                ORDER BY u.name
-            """)
-            teachers = cur.fetchall()
-            conn.close()
-            return render_template(
-                "admin_teachers.html",
-                classes=classes, teachers=teachers,
-                error="Teacher not found. Register teacher first.",
-                title="Admin", header="Assign Teachers", subheader="Attach teachers to classes"
-            )
-
-        cur.execute("""
-            INSERT OR IGNORE INTO teacher_class (email, class_id)
-            VALUES (?, ?)
-        """, (teacher_email, class_id))
-        conn.commit()
-
-    cur.execute("SELECT * FROM classes ORDER BY dept, name")
-    classes = cur.fetchall()
-
-    cur.execute("""
-        SELECT u.name, u.email, tp.dept
-        FROM users u
-        LEFT JOIN teacher_profile tp ON tp.email=u.email
-        WHERE u.role='teacher'
-        ORDER BY u.name
-    """)
-    teachers = cur.fetchall()
+                INSERT OR IGNORE INTO teacher_class (email, class_id)
+                VALUES (?, ?)
+            """, (teacher_email, class_row["id"]))
+            if cur.rowcount:
+                bump_claims_version(cur)
+            conn.commit()
+            g.pop("claims_version", None)
 
-    conn.close()
     return render_template(
         "admin_teachers.html",
-        classes=classes, teachers=teachers,
+        teachers=search_users(cur, "", "teacher"), error=error,
         title="Admin", header="Assign Teachers", subheader="Attach teachers to classes"
     )
 
+# ---------------- ADMIN: ROSTER IMPORT ----------------
+ROSTER_COLUMNS = ["email", "name", "role", "password", "class_code", "dept"]
+ROSTER_CHUNK = 1000
+ROSTER_MAX_ERRORS = 500  # errors listed on the page; the count covers all of them
+
+def import_roster(conn, rows):
+    # rows: dicts with ROSTER_COLUMNS (class_code for students, dept for teachers).
+    # Class codes are resolved once; each chunk is validated in Python and
+    # inserted with executemany inside a single transaction.
+    cur = conn.cursor()
+    cur.execute("SELECT id, class_code FROM classes")
+    class_ids = {r["class_code"]: r["id"] for r in cur.fetchall()}
+    default_class = class_ids.get(DEFAULT_CLASS_CODE)
+
+    imported, errors, seen = 0, [], set()
+    chunk = []
+
+    def flush(chunk):
+        emails = [r["email"] for _, r in chunk]
+        cur.execute(f"SELECT email FROM users WHERE email IN ({','.join('?' * len(emails))})", emails)
+        existing = {r["email"] for r in cur.fetchall()}
+        users, students, teachers = [], [], []
+        for line, r in chunk:
+            if r["email"] in existing:
+                errors.append((line, r["email"], "User exists"))
+                continue
+            users.append((r["email"], r["password"], r["role"], r["name"]))
+            if r["role"] == "student":
+                students.append((r["email"], class_ids[r["class_code"]]))
+            else:
+                teachers.append((r["email"], r["dept"]))
+        try:
+            cur.execute("BEGIN IMMEDIATE")
+            cur.executemany("INSERT INTO users (email, password, role, name) VALUES (?, ?, ?, ?)", users)
+            cur.executemany("INSERT INTO student_profile (email, class_id) VALUES (?, ?)", students)
+            cur.executemany("INSERT INTO teacher_profile (email, dept) VALUES (?, ?)", teachers)
+            if default_class:
+                # Same as /register: teachers start on the default class
+                cur.executemany("INSERT OR IGNORE INTO teacher_class (email, class_id) VALUES (?, ?)",
+                                [(email, default_class) for email, _ in teachers])
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            errors.extend((line, r["email"], f"Chunk not imported: {e}") for line, r in chunk
+                          if r["email"] not in existing)
+            return 0
+        return len(users)
+
+    # Line 1 is the CSV header
+    for line, raw in enumerate(rows, start=2):
+        r = {k: (raw.get(k) or "").strip() for k in ROSTER_COLUMNS}
+        r["email"] = r["email"].lower()
+        r["role"] = r["role"].lower()
+        r["class_code"] = r["class_code"].upper()
+        if not r["email"] or not r["password"]:
+            error = "Email and password required"
+        elif r["role"] not in ("student", "teacher"):
+            error = "Role must be student or teacher"
+        elif r["email"] in seen:
+            error = "Duplicate email in file"
+        elif r["role"] == "student" and not r["class_code"]:
+            error = "Class code required for students"
+        elif r["role"] == "student" and r["class_code"] not in class_ids:
+            error = "Invalid class code"
+        elif r["role"] == "teacher" and not r["dept"]:
+            error = "Department required for teachers"
+        else:
+            error = None
+        if error:
+            errors.append((line, r["email"], error))
+            continue
+        seen.add(r["email"])
+        chunk.append((line, r))
+        if len(chunk) >= ROSTER_CHUNK:
+            imported += flush(chunk)
+            chunk = []
+    if chunk:
+        imported += flush(chunk)
+
+    errors.sort()
+    return imported, errors
+
+@app.route("/admin/import", methods=["GET", "POST"])
+@login_required("admin")
+def admin_import():
+    result = None
+    error = None
+    if request.method == "POST":
+        try:
+            upload, too_large = request.files.get("roster"), False
+        except RequestEntityTooLarge:
+            upload, too_large = None, True
+        if too_large:
+            error = f"File is larger than {app.config['MAX_CONTENT_LENGTH'] // 2**20} MiB"
+        elif not upload or not upload.filename:
+            error = "Choose a CSV file"
+        else:
+            try:
+                text = upload.read().decode("utf-8-sig")
+            except UnicodeDecodeError:
+                text = None
+                error = "File must be UTF-8 CSV"
+            if text is not None:
+                reader = csv.DictReader(io.StringIO(text))
+                missing = [c for c in ("email", "role", "password") if c not in (reader.fieldnames or [])]
+                if missing:
+                    error = "Missing columns: " + ", ".join(missing)
+                else:
+                    start = time.perf_counter()
+                    imported, errors = import_roster(get_db(), reader)
+                    result = {"imported": imported, "failed": len(errors),
+                              "errors": errors[:ROSTER_MAX_ERRORS],
+                              "seconds": round(time.perf_counter() - start, 2)}
+
+    return render_template("admin_import.html", result=result, error=error, columns=ROSTER_COLUMNS,
+                           title="Admin", header="Import Roster", subheader="Bulk-create students and teachers from CSV")
+
+@app.cli.command("import-roster")
+@click.argument("path")
+def import_roster_command(path):
+    """Import students and teachers from a roster CSV."""
+    conn = connect()
+    conn.isolation_level = None
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        imported, errors = import_roster(conn, csv.DictReader(f))
+    conn.close()
+    for line, email, error in errors:
+        print(f"line {line}: {email or '-'}: {error}")
+    print(f"imported {imported} users, {len(errors)} rows failed")
+
+# ---------------- ADMIN: CACHE ----------------
+@app.route("/admin/cache")
+@login_required("admin")
+def admin_cache_stats():
+    return jsonify(read_cache.stats())
+
+@app.route("/admin/cache/clear", methods=["POST"])
+@login_required("admin")
+def admin_cache_clear():
+    read_cache.clear()
+    return jsonify(read_cache.stats())
+
 # ---------------- TEACHER DASHBOARD ----------------
 @app.route("/teacher")
 @login_required("teacher")
 def teacher_dashboard():
     conn = get_db()
     cur = conn.cursor()
-    cur.execute("""
-        SELECT c.id, c.name, c.dept, c.class_code
-        FROM teacher_class tc
-        JOIN classes c ON c.id = tc.class_id
-        WHERE tc.email=?
-        ORDER BY c.name
-    """, (session["email"],))
-    classes = cur.fetchall()
-    conn.close()
 
     return render_template("teacher.html",
-                           classes=classes,
+                           class_options=class_options(cur, teacher_class_ids()),
                            otp=None,
                            title="Teacher", header="Teacher Dashboard", subheader="Generate OTP for your class")
 
@@ -448,7 +2017,6 @@ def teacher_profile_page():
     cur.execute("SELECT dept FROM teacher_profile WHERE email=?", (session["email"],))
     prof = cur.fetchone()
 
-    conn.close()
     return render_template("teacher_profile.html", user=user, prof=prof,
                            title="Teacher Profile", header="Teacher Profile", subheader="Your details")
 
@@ -458,38 +2026,27 @@ def teacher_classes_page():
     conn = get_db()
     cur = conn.cursor()
 
-    cur.execute("""
-        SELECT c.id, c.name, c.dept, c.class_code
-        FROM teacher_class tc
-        JOIN classes c ON c.id = tc.class_id
-        WHERE tc.email=?
-        ORDER BY c.name
-    """, (session["email"],))
-    classes = cur.fetchall()
+    classes = teacher_classes(cur)
 
     selected_class_id = request.args.get("class_id")
     students = []
+    enrolled = 0
     selected_class = None
 
     if selected_class_id:
-        cur.execute("SELECT * FROM classes WHERE id=?", (selected_class_id,))
-        selected_class = cur.fetchone()
+        selected_class = cached_class(cur, selected_class_id)
 
-        cur.execute("""
-            SELECT u.name, u.email
-            FROM student_profile sp
-            JOIN users u ON u.email = sp.email
-            WHERE sp.class_id=?
-            ORDER BY u.name
-        """, (selected_class_id,))
-        students = cur.fetchall()
-
-    conn.close()
+    if selected_class:
+        # First page of the roster; the search box on the page asks
+        # /api/search/students for the rest
+        cur.execute("SELECT COUNT(*) AS n FROM student_profile WHERE class_id=?", (selected_class["id"],))
+        enrolled = cur.fetchone()["n"]
+        students = search_users(cur, "", "student", class_id=selected_class["id"])
 
     return render_template("teacher_classes.html",
                            classes=classes,
                            selected_class=selected_class,
-                           students=students,
+                           students=students, enrolled=enrolled,
                            title="My Classes", header="My Classes", subheader="Classes and enrolled students")
 
 # ---------------- STUDENT DASHBOARD ----------------
@@ -516,7 +2073,6 @@ def student_profile_page():
     """, (session["email"],))
     class_info = cur.fetchone()
 
-    conn.close()
 
     return render_template("student_profile.html",
                            user=user, class_info=class_info,
@@ -525,32 +2081,20 @@ def student_profile_page():
 @app.route("/student/schedule")
 @login_required("student")
 def student_schedule_page():
-    conn = get_db()
-    cur = conn.cursor()
-
-    cur.execute("SELECT class_id FROM student_profile WHERE email=?", (session["email"],))
-    sp = cur.fetchone()
-    if not sp:
-        conn.close()
+    # Same timetable card for the whole class; a revalidating browser gets a
+    # 304 without a query or a render
+    class_id = student_class_id()
+    if class_id is None:
         return "Student not enrolled", 400
 
-    cur.execute("""
-        SELECT day, start_time, end_time
-        FROM class_schedule
-        WHERE class_id=?
-        ORDER BY
-          CASE day
-            WHEN 'Monday' THEN 1 WHEN 'Tuesday' THEN 2 WHEN 'Wednesday' THEN 3
-            WHEN 'Thursday' THEN 4 WHEN 'Friday' THEN 5 WHEN 'Saturday' THEN 6
-            WHEN 'Sunday' THEN 7 ELSE 8
-          END, start_time
-    """, (sp["class_id"],))
-    schedule = cur.fetchall()
-    conn.close()
+    card, card_etag = cached_fragment(
+        ("schedule_card", class_id), "fragments/schedule_card.html",
+        lambda: {"schedule": cached_schedule(get_db().cursor(), class_id)})
 
-    return render_template("student_schedule.html",
-                           schedule=schedule,
-                           title="Schedule", header="Class Schedule", subheader="Your timetable")
+    return conditional_page([card_etag], lambda: render_template(
+        "student_schedule.html",
+        schedule_card=card,
+        title="Schedule", header="Class Schedule", subheader="Your timetable"))
 
 @app.route("/student/attendance")
 @login_required("student")
@@ -558,33 +2102,69 @@ def student_attendance_page():
     conn = get_db()
     cur = conn.cursor()
 
-    cur.execute("""
-        SELECT a.timestamp, c.name as class_name, c.class_code
-        FROM attendance a
+    where, params = ["a.email=?"], [session["email"]]
+    filters = {k: request.args[k] for k in ("class_id", "from", "to") if k in request.args}
+    attendance_filters(filters, where, params)
+    rows, next_cursor = fetch_attendance_page(cur, """
+        SELECT a.id, a.timestamp, c.name as class_name, c.class_code
+        FROM {attendance} a
         LEFT JOIN classes c ON c.id = a.class_id
-        WHERE a.email=?
-        ORDER BY a.timestamp DESC
-        LIMIT 200
-    """, (session["email"],))
-    rows = cur.fetchall()
-    conn.close()
+    """, where, params, filter_range(filters))
 
     records = [{
         "class": f"{(r['class_name'] or '-') } ({(r['class_code'] or '-')})",
-        "time": datetime.fromtimestamp(r["timestamp"]).strftime("%d-%b-%Y %I:%M %p")
+        "time": format_timestamp(r["timestamp"])
     } for r in rows]
 
     return render_template("student_attendance.html",
-                           records=records,
+                           records=records, filters=request.args,
+                           next_url=page_url(before=next_cursor) if next_cursor else None,
+                           first_url=page_url(before=None) if request.args.get("before") else None,
                            title="Attendance", header="Attendance History", subheader="Your logs")
 
+# ---------------- OTP ----------------
+# Shared by the HTML routes below and the JSON API
+def open_session(cur, email, class_id, started_at, expires_at):
+    cur.execute("""
+        INSERT INTO attendance_session (class_id, created_by, started_at, expires_at)
+        VALUES (?, ?, ?, ?)
+    """, (class_id, email, started_at, expires_at))
+    return cur.lastrowid
+
+def issue_otp(conn, email, class_id):
+    # Each OTP opens a new attendance session for the class
+    otp_code = str(random.randint(100000, 999999))
+    ts = int(time.time())
+    cur = conn.cursor()
+    session_id = open_session(cur, email, class_id, ts, ts + OTP_TTL)
+    cur.execute("DELETE FROM otp WHERE class_id=?", (class_id,))
+    cur.execute("""
+        INSERT INTO otp (code, class_id, created_time, created_by, session_id)
+        VALUES (?, ?, ?, ?, ?)
+    """, (otp_code, class_id, ts, email, session_id))
+    conn.commit()
+    # Every worker's cached copy of the old code is now stale; the first
+    # submission reads the new one from the table
+    otp_store.bump(class_id)
+    return otp_code, ts
+
+def check_otp(cur, class_id, entered_otp):
+    # Returns the matching (code, created_time, session_id) entry, or None if invalid/expired.
+    # Validate against the in-memory store; only a miss (including a code
+    # regenerated by any worker since it was cached) or a mismatch reads the
+    # otp table.
+    entry = otp_store.get(class_id)
+    if not entry or entry[0] != entered_otp:
+        entry = load_otp(cur, class_id)
+    if entry and entered_otp == entry[0] and int(time.time()) - entry[1] <= OTP_TTL:
+        return entry
+    return None
+
 # ---------------- OTP (Teacher) ----------------
 @app.route("/generate_otp", methods=["POST"])
 @login_required("teacher")
 def generate_otp():
     email = session["email"]
-    otp_code = str(random.randint(100000, 999999))
-    ts = int(time.time())
 
     class_id = request.form.get("class_id")
     if not class_id:
@@ -593,75 +2173,394 @@ def generate_otp():
     conn = get_db()
     cur = conn.cursor()
 
-    cur.execute("SELECT 1 FROM teacher_class WHERE email=? AND class_id=?", (email, class_id))
-    if not cur.fetchone():
-        conn.close()
+    if not class_id.isdigit() or int(class_id) not in teacher_class_ids():
         return "Not assigned to this class", 403
 
-    cur.execute("DELETE FROM otp WHERE class_id=?", (class_id,))
-    cur.execute("""
-        INSERT INTO otp (code, class_id, created_time, created_by)
-        VALUES (?, ?, ?, ?)
-    """, (otp_code, class_id, ts, email))
-    conn.commit()
-
-    cur.execute("""
-        SELECT c.id, c.name, c.dept, c.class_code
-        FROM teacher_class tc
-        JOIN classes c ON c.id = tc.class_id
-        WHERE tc.email=?
-        ORDER BY c.name
-    """, (email,))
-    classes = cur.fetchall()
-    conn.close()
+    otp_code, _ = issue_otp(conn, email, int(class_id))
 
     return render_template("teacher.html",
-                           classes=classes,
+                           class_options=class_options(cur, teacher_class_ids()),
                            otp=otp_code,
                            title="Teacher", header="Teacher Dashboard", subheader="Generate OTP for your class")
 
 # ---------------- OTP Submit (Student) ----------------
 @app.route("/submit_otp", methods=["POST"])
 @login_required("student")
+@rate_limited("submit_otp", otp_rate_keys)
 def submit_otp():
     entered_otp = request.form["otp"].strip()
 
     conn = get_db()
     cur = conn.cursor()
 
-    cur.execute("SELECT class_id FROM student_profile WHERE email=?", (session["email"],))
-    student = cur.fetchone()
-    if not student:
-        conn.close()
+    class_id = student_class_id()
+    if class_id is None:
         return "Student not enrolled", 400
 
-    cur.execute("""
-        SELECT code, created_time FROM otp
-        WHERE class_id=?
-        ORDER BY created_time DESC
-        LIMIT 1
-    """, (student["class_id"],))
-    otp_row = cur.fetchone()
+    entry = check_otp(cur, class_id, entered_otp)
+    if entry:
+        if not attendance_writer.submit(session["email"], class_id, int(time.time()), entry[2]):
+            return render_template("student.html", error=True,
+                                   title="Student", header="Student Dashboard",
+                                   subheader="Could not save attendance, try again"), 503
+        return render_template("student.html", success=True,
+                               title="Student", header="Student Dashboard", subheader="Marked successfully")
 
-    if otp_row:
-        valid = (
-            entered_otp == otp_row["code"]
-            and int(time.time()) - otp_row["created_time"] <= 60
-        )
-        if valid:
-            cur.execute("""
-                INSERT INTO attendance (email, class_id, timestamp)
-                VALUES (?, ?, ?)
-            """, (session["email"], student["class_id"], int(time.time())))
-            conn.commit()
-            conn.close()
-            return render_template("student.html", success=True,
-                                   title="Student", header="Student Dashboard", subheader="Marked successfully")
-
-    conn.close()
     return render_template("student.html", error=True,
                            title="Student", header="Student Dashboard", subheader="Invalid/Expired OTP")
 
+# ---------------- JSON API ----------------
+# Small JSON payloads for the mobile client and kiosk scanners; no templates
+# are rendered. Same session cookie as the HTML routes. Bodies may be JSON or
+# form-encoded.
+def api_login_required(role):
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if "email" not in session:
+                return jsonify(error="login_required"), 401
+            if session.get("role") != role:
+                return jsonify(error="forbidden"), 403
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def api_body():
+    # The request's JSON object, or its form; any other JSON value is a 400
+    body = request.get_json(silent=True)
+    if body is None:
+        return request.form
+    if not isinstance(body, dict):
+        abort(make_response(jsonify(error="invalid_body"), 400))
+    return body
+
+def api_param(name):
+    body = api_body()
+    return str(body.get(name) or "").strip()
+
+@app.route("/api/otp/generate", methods=["POST"])
+@api_login_required("teacher")
+def api_generate_otp():
+    class_id = api_param("class_id")
+    if not class_id.isdigit():
+        return jsonify(error="class_id_required"), 400
+
+    if int(class_id) not in teacher_class_ids():
+        return jsonify(error="not_assigned"), 403
+
+    otp_code, ts = issue_otp(get_db(), session["email"], int(class_id))
+    return jsonify(otp=otp_code, class_id=int(class_id), expires_at=ts + OTP_TTL)
+
+@app.route("/api/otp/check", methods=["POST"])
+@api_login_required("student")
+@rate_limited("submit_otp", otp_rate_keys)
+def api_check_otp():
+    # Validates without marking attendance, e.g. for scanner feedback
+    cur = get_db().cursor()
+    class_id = student_class_id()
+    if class_id is None:
+        return jsonify(error="not_enrolled"), 400
+    entry = check_otp(cur, class_id, api_param("otp"))
+    if not entry:
+        return jsonify(valid=False)
+    return jsonify(valid=True, expires_in=max(0, entry[1] + OTP_TTL - int(time.time())))
+
+@app.route("/api/otp/submit", methods=["POST"])
+@api_login_required("student")
+@rate_limited("submit_otp", otp_rate_keys)
+def api_submit_otp():
+    cur = get_db().cursor()
+    class_id = student_class_id()
+    if class_id is None:
+        return jsonify(error="not_enrolled"), 400
+    entry = check_otp(cur, class_id, api_param("otp"))
+    if not entry:
+        return jsonify(ok=False, error="invalid_otp"), 400
+    if not attendance_writer.submit(session["email"], class_id, int(time.time()), entry[2]):
+        return jsonify(ok=False, error="not_saved"), 503
+    return jsonify(ok=True)
+
+# ---------------- BULK MARK (Teacher) ----------------
+# Fallback for when OTPs cannot be collected (projector or Wi-Fi down): the
+# teacher posts the students present and they are marked in one
+# transaction. Without a session_id a new attendance session is opened, so
+# the same list can be re-posted to correct it without double marking.
+BULK_MARK_MAX = 1000
+
+def bulk_mark(conn, teacher_email, class_id, session_id, emails):
+    # Returns (session_id, [{"email", "status"}]) in request order, or
+    # (None, None) if the session does not belong to the teacher's class.
+    # status: marked | already_marked | not_enrolled
+    cur = conn.cursor()
+    ts = int(time.time())
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        if session_id is None:
+            session_id = open_session(cur, teacher_email, class_id, ts, ts)
+        # One set-based check: the teacher teaches the class, the session
+        # is the class's, and which of the emails are enrolled / marked
+        cur.execute("""
+            WITH requested(email) AS (SELECT DISTINCT value FROM json_each(?))
+            SELECT r.email,
+                   sp.email IS NOT NULL AS enrolled,
+                   a.id IS NOT NULL AS marked
+            FROM requested r
+            JOIN teacher_class tc ON tc.email = ? AND tc.class_id = ?
+            JOIN attendance_session s ON s.id = ? AND s.class_id = tc.class_id
+            LEFT JOIN student_profile sp ON sp.email = r.email AND sp.class_id = tc.class_id
+            LEFT JOIN attendance a ON a.session_id = s.id AND a.email = r.email
+        """, (json.dumps(emails), teacher_email, class_id, session_id))
+        found = {r["email"]: r for r in cur.fetchall()}
+        if not found:
+            conn.rollback()
+            return None, None
+        status = {}
+        rows = []
+        for email, r in found.items():
+            if not r["enrolled"]:
+                status[email] = "not_enrolled"
+            elif r["marked"]:
+                status[email] = "already_marked"
+            else:
+                status[email] = "marked"
+                rows.append((email, class_id, ts, session_id))
+        cur.executemany(AttendanceWriter.INSERT_SQL, rows)
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    if rows:
+        attendance_feed.notify()
+    return session_id, [{"email": email, "status": status[email]} for email in emails]
+
+@app.route("/api/attendance/bulk", methods=["POST"])
+@api_login_required("teacher")
+def api_bulk_mark():
+    # {"class_id": 1, "emails": [...], "session_id": 42 (optional)}
+    body = request.get_json(silent=True)
+    if body is None:
+        body = {}
+    elif not isinstance(body, dict):
+        return jsonify(error="invalid_body"), 400
+    class_id = str(body.get("class_id") or "")
+    session_id = str(body.get("session_id") or "")
+    emails = body.get("emails")
+    if isinstance(emails, str):
+        emails = emails.replace(",", " ").split()
+    if not class_id.isdigit():
+        return jsonify(error="class_id_required"), 400
+    if session_id and not session_id.isdigit():
+        return jsonify(error="invalid_session"), 400
+    if not isinstance(emails, list) or not emails or not all(isinstance(e, str) for e in emails):
+        return jsonify(error="emails_required"), 400
+    emails = list(dict.fromkeys(e.strip().lower() for e in emails if e.strip()))
+    if not emails:
+        return jsonify(error="emails_required"), 400
+    if len(emails) > BULK_MARK_MAX:
+        return jsonify(error="too_many_emails", max=BULK_MARK_MAX), 400
+    if int(class_id) not in teacher_class_ids():
+        return jsonify(error="not_assigned"), 403
+
+    session_id, results = bulk_mark(get_db(), session["email"], int(class_id),
+                                    int(session_id) if session_id else None, emails)
+    if results is None:
+        return jsonify(error="invalid_session"), 400
+    counts = {}
+    for r in results:
+        counts[r["status"]] = counts.get(r["status"], 0) + 1
+    return jsonify(session_id=session_id, counts=counts, results=results)
+
+# ---------------- TYPEAHEAD SEARCH ----------------
+# Top-N matches from the FTS5 indexes (migration 8), so admin and teacher
+# screens never render full user or class lists. Every word typed is a
+# prefix and all must match: "ann sm" finds "Anna Smith". An empty query
+# returns the first N by name.
+SEARCH_LIMIT = 10
+SEARCH_MAX_LIMIT = 50
+
+def search_terms(text):
+    words = re.findall(r"[^\W_]+", text.lower())[:8]
+    return " ".join(f'"{w}"*' for w in words)
+
+def search_limit():
+    limit = request.args.get("limit", "")
+    return min(int(limit), SEARCH_MAX_LIMIT) if limit.isdigit() and int(limit) > 0 else SEARCH_LIMIT
+
+def search_users(cur, text, role, class_id=None, limit=SEARCH_LIMIT):
+    # Users of one role, optionally only those enrolled in class_id
+    terms = search_terms(text)
+    enrolled = "JOIN student_profile sp ON sp.email = u.email AND sp.class_id = ?" if class_id else ""
+    params = (class_id,) if class_id else ()
+    if terms:
+        cur.execute(f"""
+            SELECT u.name, u.email, tp.dept
+            FROM user_search s
+            JOIN users u ON u.email = s.email
+            {enrolled}
+            LEFT JOIN teacher_profile tp ON tp.email = u.email
+            WHERE user_search MATCH ? AND s.role = ?
+            ORDER BY s.rank, u.name
+            LIMIT ?
+        """, (*params, terms, role, limit))
+    else:
+        cur.execute(f"""
+            SELECT u.name, u.email, tp.dept
+            FROM users u
+            {enrolled}
+            LEFT JOIN teacher_profile tp ON tp.email = u.email
+            WHERE u.role = ?
+            ORDER BY u.name
+            LIMIT ?
+        """, (*params, role, limit))
+    return [dict(r) for r in cur.fetchall()]
+
+def search_classes(cur, text, limit=SEARCH_LIMIT):
+    terms = search_terms(text)
+    if not terms:
+        return [dict(c) for c in cached_classes(cur)[:limit]]
+    cur.execute("""
+        SELECT c.id, c.name, c.dept, c.class_code
+        FROM class_search s
+        JOIN classes c ON c.id = s.rowid
+        WHERE class_search MATCH ?
+        ORDER BY s.rank, c.name
+        LIMIT ?
+    """, (terms, limit))
+    return [dict(r) for r in cur.fetchall()]
+
+@app.route("/api/search/users")
+@api_login_required("admin")
+def api_search_users():
+    role = request.args.get("role", "teacher")
+    if role not in ("admin", "teacher", "student"):
+        return jsonify(error="invalid_role"), 400
+    return jsonify(results=search_users(get_db().cursor(), request.args.get("q", ""), role, limit=search_limit()))
+
+@app.route("/api/search/classes")
+@api_login_required("admin")
+def api_search_classes():
+    return jsonify(results=search_classes(get_db().cursor(), request.args.get("q", ""), search_limit()))
+
+@app.route("/api/search/students")
+@api_login_required("teacher")
+def api_search_students():
+    # Students of one of the teacher's own classes
+    class_id = request.args.get("class_id", "")
+    if not class_id.isdigit():
+        return jsonify(error="class_id_required"), 400
+    if int(class_id) not in teacher_class_ids():
+        return jsonify(error="not_assigned"), 403
+    return jsonify(results=search_users(get_db().cursor(), request.args.get("q", ""), "student",
+                                        class_id=int(class_id), limit=search_limit()))
+
+# ---------------- LIVE ATTENDANCE (SSE) ----------------
+def sse(event, data, event_id=None):
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def live_access_error(class_id):
+    role = session.get("role")
+    if role not in ("teacher", "admin"):
+        return "Login required", 401
+    if role == "teacher" and class_id not in teacher_class_ids():
+        return "Not assigned to this class", 403
+    return None
+
+def live_checkins(cur, class_id, after=0):
+    # Today's check-ins for the class with an id above `after`
+    midnight = int(datetime.combine(date.today(), datetime.min.time()).timestamp())
+    cur.execute("""
+        SELECT a.id, a.email, u.name, a.class_id, a.timestamp
+        FROM attendance a
+        LEFT JOIN users u ON u.email = a.email
+        WHERE a.class_id=? AND a.timestamp>=? AND a.id>?
+        ORDER BY a.id
+    """, (class_id, midnight, after))
+    return [feed_event(r) for r in cur.fetchall()]
+
+@app.route("/live/<int:class_id>")
+def live_attendance(class_id):
+    # Server-sent events: a "snapshot" of today's check-ins for the class,
+    # then one "attendance" event per accepted submission
+    error = live_access_error(class_id)
+    if error:
+        return error
+
+    cur = get_db().cursor()
+    sub = attendance_feed.subscribe(cur, class_id, limit=FEED_MAX_STREAMS)
+    if sub is None:
+        # EventSource gives up on a 503; the page switches to /poll
+        return "Too many live viewers, try again later", 503, {"Retry-After": str(FEED_RETRY_AFTER)}
+    snapshot = live_checkins(cur, class_id)
+    last_id = snapshot[-1]["id"] if snapshot else 0
+
+    # Not stream_with_context: the pooled connection goes back at the end of
+    # this function instead of being held for the whole stream
+    def generate():
+        seen = last_id
+        try:
+            yield "retry: 3000\n" + sse("snapshot", snapshot, seen)
+            deadline = time.monotonic() + FEED_MAX_SECONDS
+            while time.monotonic() < deadline:
+                try:
+                    event = sub.get(timeout=FEED_KEEPALIVE)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                if event is None:
+                    break
+                if event["id"] <= seen:
+                    continue
+                seen = event["id"]
+                yield sse("attendance", event, seen)
+        finally:
+            attendance_feed.unsubscribe(class_id, sub)
+
+    return Response(generate(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/live/<int:class_id>/poll")
+def live_attendance_poll(class_id):
+    # Fallback for viewers refused a stream: check-ins after `after`, one
+    # short request per tick instead of a held thread
+    error = live_access_error(class_id)
+    if error:
+        return error
+    after = request.args.get("after", "0")
+    events = live_checkins(get_db().cursor(), class_id, int(after) if after.isdigit() else 0)
+    return jsonify(events=events, retry_stream_after=FEED_RETRY_AFTER)
+
+# ---------------- METRICS ENDPOINT ----------------
+@app.route("/metrics")
+def metrics_endpoint():
+    if METRICS_TOKEN:
+        if request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+            return "Forbidden", 403
+    elif request.remote_addr not in METRICS_LOCAL_ADDRS:
+        return "Forbidden", 403
+    gauges = []
+    for prefix, cache in (("read_cache", read_cache), ("fragment_cache", fragment_cache)):
+        stats = cache.stats()
+        gauges += [
+            (f"cloud_attendance_{prefix}_entries", "gauge", stats["size"]),
+            (f"cloud_attendance_{prefix}_hits_total", "counter", stats["hits"]),
+            (f"cloud_attendance_{prefix}_misses_total", "counter", stats["misses"]),
+            (f"cloud_attendance_{prefix}_evictions_total", "counter", stats["evictions"]),
+        ]
+    gauges += [
+        ("cloud_attendance_otp_store_entries", "gauge", len(otp_store)),
+        ("cloud_attendance_rate_limit_buckets", "gauge", len(rate_limiter)),
+        ("cloud_attendance_live_viewers", "gauge", attendance_feed.viewers()),
+        ("cloud_attendance_attendance_queue_depth", "gauge", attendance_writer.pending()),
+        ("cloud_attendance_db_pool_idle_connections", "gauge", db_pool.idle()),
+    ]
+    if report_snapshot is not None:
+        gauges += [
+            ("cloud_attendance_report_snapshot_age_seconds", "gauge", round(report_snapshot.age() or 0, 1)),
+            ("cloud_attendance_report_snapshot_refreshes_total", "counter", report_snapshot.refreshes),
+        ]
+    return Response(metrics.render(gauges), mimetype="text/plain; version=0.0.4")
+
 # ---------------- LOGOUT ----------------
 @app.route("/logout")
 def logout():
@@ -0,0 +1,55 @@
+import multiprocessing, os
+
+# Production server settings: gunicorn -c gunicorn.conf.py app:app
+#
+# Pre-forked worker processes, each with a few threads. SQLite allows one
+# writer at a time however many processes there are, so the defaults favour
+# a worker per core (each with its own attendance writer batching inserts)
+# over many processes that would only queue on the WAL write lock.
+# Every setting can be overridden from the environment.
+
+bind = os.environ.get("CLOUD_ATTENDANCE_BIND", "0.0.0.0:5000")
+
+# Worker count follows the core count, capped so a large VM doesn't start
+# dozens of processes contending for the same database.db
+workers = int(os.environ.get("WEB_CONCURRENCY", min(multiprocessing.cpu_count(), 8)))
+# Read by app.py: several workers that did not fork from a preloaded app
+# cannot share the OTP store's generation counters
+os.environ["WEB_CONCURRENCY"] = str(workers)
+worker_class = "gthread"
+# app.py reads the same variable: live feed streams may hold all but 4 of
+# these threads. The threads mostly sit waiting on a queue, so 16 is cheap.
+threads = int(os.environ.get("CLOUD_ATTENDANCE_THREADS", "16"))
+
+# Import app.py once in the master. Nothing opens a connection or starts a
+# thread at import time except check_schema(), which closes its connection,
+# so forked workers start with an empty pool and their own writer.
+preload_app = True
+
+# Worker heartbeat: the master restarts a worker that has not checked in for
+# this long. With gthread the heartbeat runs on the worker's main thread, so
+# this does not limit how long a request takes; gthread has no per-request
+# timeout. Slow writes are bounded by the 5s SQLite busy timeout and the 10s
+# attendance commit wait instead.
+timeout = int(os.environ.get("CLOUD_ATTENDANCE_TIMEOUT", "30"))
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers now and then so no process holds memory forever
+max_requests = 5000
+max_requests_jitter = 500
+
+accesslog = "-"
+errorlog = "-"
+
+def when_ready(server):
+    # In reporting snapshot mode, build the copy before any worker serves a
+    # report, so no request waits for a whole-database backup
+    from app import report_snapshot
+    if report_snapshot is not None:
+        report_snapshot.refresh(older_than=report_snapshot.refresh_after)
+
+def worker_exit(server, worker):
+    # Commit whatever the attendance writer still has queued before exiting
+    from app import attendance_writer
+    attendance_writer.stop()
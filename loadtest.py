@@ -0,0 +1,228 @@
+import argparse, json, logging, math, os, re, sqlite3, sys, tempfile, threading, time
+import http.cookiejar, urllib.error, urllib.parse, urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+# Classroom-burst load test. Seeds a throwaway database through the real
+# migrations, serves app.py from a local threaded server, then for every
+# round each class's teacher calls /generate_otp and all of its students
+# fire /submit_otp at once. Reports throughput, p50/p95/p99 latency per
+# route and lock-contention errors. Nothing leaves 127.0.0.1:
+#
+#   python loadtest.py --classes 10 --students 60 --rounds 3 --concurrency 64
+#
+# --max-p99-ms / --max-error-rate make it exit non-zero, for CI.
+
+PASSWORD = "loadtest"
+OTP_RE = re.compile(r"OTP: <b[^>]*>(\d{6})</b>")
+
+# ---------------- SEED ----------------
+def seed(db_path, classes, students):
+    import migrations
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    migrations.migrate(conn, log=lambda msg: None)
+    conn.isolation_level = ""
+    conn.executemany("INSERT INTO classes (name, dept, class_code) VALUES (?, ?, ?)",
+                     [(f"LT-{i}", "LOAD", f"LT{i:04d}") for i in range(classes)])
+    class_ids = [r[0] for r in conn.execute("SELECT id FROM classes WHERE dept='LOAD' ORDER BY id")]
+    teachers, roster = [], {}
+    for i, class_id in enumerate(class_ids):
+        teacher = f"teacher{i}@load.test"
+        teachers.append((teacher, class_id))
+        roster[class_id] = [f"s{i}-{j}@load.test" for j in range(students)]
+    conn.executemany("INSERT INTO users (email, password, role, name) VALUES (?, ?, 'teacher', ?)",
+                     [(t, PASSWORD, t) for t, _ in teachers])
+    conn.executemany("INSERT INTO teacher_profile (email, dept) VALUES (?, 'LOAD')",
+                     [(t,) for t, _ in teachers])
+    conn.executemany("INSERT INTO teacher_class (email, class_id) VALUES (?, ?)", teachers)
+    rows = [(email, class_id) for class_id, emails in roster.items() for email in emails]
+    conn.executemany("INSERT INTO users (email, password, role, name) VALUES (?, ?, 'student', ?)",
+                     [(email, PASSWORD, email) for email, _ in rows])
+    conn.executemany("INSERT INTO student_profile (email, class_id) VALUES (?, ?)", rows)
+    conn.commit()
+    conn.close()
+    return teachers, roster
+
+# ---------------- CLIENT ----------------
+class Stats:
+    def __init__(self):
+        self.latencies = {}
+        self.failures = {}
+        self._lock = threading.Lock()
+
+    def record(self, route, seconds, ok):
+        with self._lock:
+            self.latencies.setdefault(route, []).append(seconds)
+            if not ok:
+                self.failures[route] = self.failures.get(route, 0) + 1
+
+class Client:
+    # One simulated browser: its own cookie jar, so its own Flask session
+    def __init__(self, base_url, stats):
+        self.base_url = base_url
+        self.stats = stats
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), NoRedirect)
+
+    def post(self, route, data, ok_status=(200,)):
+        body = urllib.parse.urlencode(data).encode()
+        start = time.perf_counter()
+        try:
+            with self.opener.open(self.base_url + route, body, timeout=60) as resp:
+                status, text = resp.status, resp.read().decode()
+        except urllib.error.HTTPError as e:
+            status, text = e.code, e.read().decode(errors="replace")
+        except OSError:
+            status, text = 0, ""
+        self.stats.record(route, time.perf_counter() - start, status in ok_status)
+        return status, text
+
+    def login(self, email, role):
+        status, _ = self.post("/", {"email": email, "password": PASSWORD, "role": role}, ok_status=(302,))
+        return status == 302
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    # The login redirect is the success signal; don't follow it
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+class LockErrors(logging.Handler):
+    # Counts "database is locked"/"busy" errors logged by the app
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.count = 0
+
+    def emit(self, record):
+        exc = record.exc_info[1] if record.exc_info else None
+        if isinstance(exc, sqlite3.OperationalError) and ("locked" in str(exc) or "busy" in str(exc)):
+            self.count += 1
+
+# ---------------- RUN ----------------
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    # nearest-rank
+    k = max(0, min(len(sorted_values) - 1, math.ceil(p / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+def run(args):
+    from werkzeug.serving import make_server
+    import app as cloud_app
+
+    lock_errors = LockErrors()
+    cloud_app.app.logger.addHandler(lock_errors)
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    server = make_server("127.0.0.1", 0, cloud_app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    stats = Stats()
+    pool = ThreadPoolExecutor(max_workers=args.concurrency)
+    teachers = [(Client(base_url, stats), email, class_id) for email, class_id in args.teachers]
+    students = {class_id: [(Client(base_url, stats), email) for email in emails]
+                for class_id, emails in args.roster.items()}
+
+    logged_in = list(pool.map(lambda t: t[0].login(t[1], "teacher"), teachers))
+    logged_in += pool.map(lambda s: s[0].login(s[1], "student"),
+                          [s for group in students.values() for s in group])
+    if not all(logged_in):
+        print(f"warning: {logged_in.count(False)} logins failed", file=sys.stderr)
+
+    marked = 0
+    started = time.perf_counter()
+    for _ in range(args.rounds):
+        # Every class gets a fresh OTP, then all students submit at once
+        otps = {}
+        for client, _, class_id in teachers:
+            _, text = client.post("/generate_otp", {"class_id": class_id})
+            match = OTP_RE.search(text)
+            if match:
+                otps[class_id] = match.group(1)
+        burst = [(client, otps[class_id]) for class_id, group in students.items()
+                 if class_id in otps for client, _ in group]
+        results = pool.map(lambda s: s[0].post("/submit_otp", {"otp": s[1]}), burst)
+        marked += sum(1 for status, text in results if status == 200 and "Attendance Marked" in text)
+    elapsed = time.perf_counter() - started
+
+    pool.shutdown()
+    server.shutdown()
+    cloud_app.attendance_writer.stop()
+    cloud_app.app.logger.removeHandler(lock_errors)
+
+    routes = {}
+    for route, values in sorted(stats.latencies.items()):
+        values.sort()
+        routes[route] = {
+            "requests": len(values),
+            "errors": stats.failures.get(route, 0),
+            "p50_ms": round(percentile(values, 50) * 1000, 2),
+            "p95_ms": round(percentile(values, 95) * 1000, 2),
+            "p99_ms": round(percentile(values, 99) * 1000, 2),
+            "max_ms": round(values[-1] * 1000, 2),
+        }
+    measured = sum(routes[r]["requests"] for r in ("/generate_otp", "/submit_otp") if r in routes)
+    return {
+        "classes": len(teachers), "students": sum(len(g) for g in students.values()),
+        "rounds": args.rounds, "concurrency": args.concurrency,
+        "durability": cloud_app.attendance_writer.durability,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(measured / elapsed, 1) if elapsed else 0.0,
+        "attendance_marked": marked,
+        "lock_errors": lock_errors.count,
+        "routes": routes,
+    }
+
+def print_report(report):
+    print(f"{report['classes']} classes, {report['students']} students, {report['rounds']} rounds, "
+          f"concurrency {report['concurrency']}, durability {report['durability']}")
+    print(f"{report['throughput_rps']} req/s over {report['elapsed_s']}s, "
+          f"{report['attendance_marked']} marked, {report['lock_errors']} lock errors")
+    print(f"{'route':<16}{'requests':>10}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for route, r in report["routes"].items():
+        print(f"{route:<16}{r['requests']:>10}{r['errors']:>8}{r['p50_ms']:>10}"
+              f"{r['p95_ms']:>10}{r['p99_ms']:>10}{r['max_ms']:>10}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Classroom-burst load test for app.py")
+    parser.add_argument("--classes", type=int, default=10)
+    parser.add_argument("--students", type=int, default=60, help="students per class")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--durability", choices=["full", "sync", "async"])
+    parser.add_argument("--json", help="also write the report to this file")
+    parser.add_argument("--max-p99-ms", type=float, help="fail if /submit_otp p99 is above this")
+    parser.add_argument("--max-error-rate", type=float, help="fail if more than this fraction of requests fail")
+    args = parser.parse_args(argv)
+
+    # app.py and migrations.py read these at import time
+    tmp = tempfile.mkdtemp(prefix="cloud-attendance-loadtest-")
+    os.environ["CLOUD_ATTENDANCE_DB"] = os.path.join(tmp, "loadtest.db")
+    if args.durability:
+        os.environ["CLOUD_ATTENDANCE_DURABILITY"] = args.durability
+    # Every simulated client shares 127.0.0.1, so per-IP throttling would
+    # measure the limiter instead of the app
+    os.environ.setdefault("CLOUD_ATTENDANCE_RATE_LIMITS", "login.ip=0/60,submit_otp.ip=0/60")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    args.teachers, args.roster = seed(os.environ["CLOUD_ATTENDANCE_DB"], args.classes, args.students)
+    report = run(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    failed = []
+    total = sum(r["requests"] for r in report["routes"].values())
+    errors = sum(r["errors"] for r in report["routes"].values())
+    submit = report["routes"].get("/submit_otp", {})
+    if args.max_p99_ms is not None and submit.get("p99_ms", 0) > args.max_p99_ms:
+        failed.append(f"/submit_otp p99 {submit['p99_ms']}ms > {args.max_p99_ms}ms")
+    if args.max_error_rate is not None and total and errors / total > args.max_error_rate:
+        failed.append(f"error rate {errors / total:.3f} > {args.max_error_rate}")
+    for reason in failed:
+        print(f"FAIL: {reason}", file=sys.stderr)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
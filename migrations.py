@@ -0,0 +1,387 @@
+import sqlite3, os, sys
+
+# Schema migrations. PRAGMA user_version records the last applied migration,
+# so app startup only has to read one integer. Run pending migrations with:
+#
+#   python migrations.py
+#
+# Never edit a migration that has shipped; append a new one instead.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.environ.get("CLOUD_ATTENDANCE_DB", os.path.join(BASE_DIR, "database.db"))
+
+DEFAULT_CLASS_CODE = "IT123"
+
+# ---------------- MIGRATIONS ----------------
+def m001_base_schema(cur):
+    # Tables that used to be created by init_db() on every import.
+    # IF NOT EXISTS keeps this safe on databases created before migrations.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS users (
+        email TEXT PRIMARY KEY,
+        password TEXT NOT NULL,
+        role TEXT CHECK(role IN ('admin','teacher','student')),
+        name TEXT
+    )
+    """)
+
+    # DEFAULT ADMIN
+    cur.execute("""
+    INSERT OR IGNORE INTO users (email, password, role, name)
+    VALUES ('admin@cloud.com', 'admin123', 'admin', 'Admin')
+    """)
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS classes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        dept TEXT NOT NULL,
+        class_code TEXT UNIQUE NOT NULL
+    )
+    """)
+
+    # DEFAULT CLASS
+    cur.execute("""
+    INSERT OR IGNORE INTO classes (name, dept, class_code)
+    VALUES ('IT-A', 'IT', ?)
+    """, (DEFAULT_CLASS_CODE,))
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS class_schedule (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        class_id INTEGER,
+        day TEXT,
+        start_time TEXT,
+        end_time TEXT,
+        FOREIGN KEY (class_id) REFERENCES classes(id)
+    )
+    """)
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS student_profile (
+        email TEXT PRIMARY KEY,
+        class_id INTEGER,
+        FOREIGN KEY (email) REFERENCES users(email),
+        FOREIGN KEY (class_id) REFERENCES classes(id)
+    )
+    """)
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS teacher_profile (
+        email TEXT PRIMARY KEY,
+        dept TEXT,
+        FOREIGN KEY (email) REFERENCES users(email)
+    )
+    """)
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS teacher_class (
+        email TEXT,
+        class_id INTEGER,
+        PRIMARY KEY (email, class_id),
+        FOREIGN KEY (email) REFERENCES users(email),
+        FOREIGN KEY (class_id) REFERENCES classes(id)
+    )
+    """)
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS attendance (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        email TEXT,
+        class_id INTEGER,
+        timestamp INTEGER,
+        FOREIGN KEY (email) REFERENCES users(email),
+        FOREIGN KEY (class_id) REFERENCES classes(id)
+    )
+    """)
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS otp (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        code TEXT,
+        class_id INTEGER,
+        created_time INTEGER,
+        created_by TEXT,
+        FOREIGN KEY (class_id) REFERENCES classes(id),
+        FOREIGN KEY (created_by) REFERENCES users(email)
+    )
+    """)
+
+    # Seed schedule for default class only once
+    cur.execute("SELECT id FROM classes WHERE class_code=?", (DEFAULT_CLASS_CODE,))
+    c = cur.fetchone()
+    if c:
+        class_id = c[0]
+        cur.execute("SELECT COUNT(*) FROM class_schedule WHERE class_id=?", (class_id,))
+        if cur.fetchone()[0] == 0:
+            cur.executemany("""
+                INSERT INTO class_schedule (class_id, day, start_time, end_time)
+                VALUES (?, ?, ?, ?)
+            """, [
+                (class_id, "Monday", "09:00", "10:00"),
+                (class_id, "Wednesday", "11:00", "12:00"),
+                (class_id, "Friday", "14:00", "15:00"),
+            ])
+
+def m002_hot_path_indexes(cur):
+    # student attendance history: WHERE email=? ORDER BY timestamp (covers class_id)
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_attendance_email_ts
+    ON attendance (email, timestamp, class_id)
+    """)
+    # admin dashboard: ORDER BY timestamp DESC (rowid/id is implicitly included)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_attendance_ts ON attendance (timestamp)")
+    # enrolled students of a class
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_student_profile_class
+    ON student_profile (class_id, email)
+    """)
+    # latest OTP of a class, answered from the index alone
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_otp_class_created
+    ON otp (class_id, created_time, code)
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_class_schedule_class ON class_schedule (class_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_teacher_class_class ON teacher_class (class_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_users_role_name ON users (role, name)")
+    cur.execute("ANALYZE")
+
+def m003_attendance_keyset_indexes(cur):
+    # Keyset pages are ordered by (timestamp, id); keep id next to timestamp
+    # so a student's history needs no extra sort, and index class_id too.
+    cur.execute("DROP INDEX IF EXISTS idx_attendance_email_ts")
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_attendance_email_ts_id
+    ON attendance (email, timestamp, id, class_id)
+    """)
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_attendance_class_ts
+    ON attendance (class_id, timestamp)
+    """)
+
+def m004_attendance_rollups(cur):
+    # Daily rollups kept current by triggers, so every insert path (OTP
+    # submits, batches, imports) updates them in the same transaction.
+    # Days are local dates, matching how timestamps are shown in the UI.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS attendance_daily (
+        email TEXT,
+        class_id INTEGER,
+        day TEXT,
+        marks INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (email, class_id, day)
+    ) WITHOUT ROWID
+    """)
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_attendance_daily_class_day
+    ON attendance_daily (class_id, day, email)
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS class_daily (
+        class_id INTEGER,
+        day TEXT,
+        present INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (class_id, day)
+    ) WITHOUT ROWID
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_attendance_rollup
+    AFTER INSERT ON attendance
+    BEGIN
+        INSERT INTO attendance_daily (email, class_id, day, marks)
+        VALUES (NEW.email, NEW.class_id, date(NEW.timestamp, 'unixepoch', 'localtime'), 1)
+        ON CONFLICT (email, class_id, day) DO UPDATE SET marks = marks + 1;
+    END
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_attendance_daily_rollup
+    AFTER INSERT ON attendance_daily
+    BEGIN
+        INSERT INTO class_daily (class_id, day, present)
+        VALUES (NEW.class_id, NEW.day, 1)
+        ON CONFLICT (class_id, day) DO UPDATE SET present = present + 1;
+    END
+    """)
+    # Backfill from existing attendance
+    cur.execute("DELETE FROM attendance_daily")
+    cur.execute("DELETE FROM class_daily")
+    cur.execute("""
+    INSERT INTO attendance_daily (email, class_id, day, marks)
+    SELECT email, class_id, date(timestamp, 'unixepoch', 'localtime'), COUNT(*)
+    FROM attendance
+    GROUP BY 1, 2, 3
+    """)
+
+def m005_claims_version(cur):
+    # Small key/value table for app-wide counters. claims_version is bumped
+    # whenever teacher/student class mappings change, so sessions that
+    # cached their classes at login know to re-read them.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS app_state (
+        key TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    )
+    """)
+    cur.execute("INSERT OR IGNORE INTO app_state (key, value) VALUES ('claims_version', 1)")
+
+def m006_attendance_archive(cur):
+    # Registry of closed terms moved out of `attendance` into read-only
+    # archive files (see `flask --app app archive-term`). start_ts/end_ts are
+    # the first and last timestamps the file holds; `file` is relative to the
+    # archive directory.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS attendance_archive (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT UNIQUE NOT NULL,
+        file TEXT NOT NULL,
+        start_ts INTEGER NOT NULL,
+        end_ts INTEGER NOT NULL,
+        row_count INTEGER NOT NULL,
+        archived_at INTEGER NOT NULL
+    )
+    """)
+
+def m007_attendance_sessions(cur):
+    # Every generated OTP opens an attendance session; a student can be
+    # marked once per session. Rows from before this migration have no
+    # session and are left as they are.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS attendance_session (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        class_id INTEGER NOT NULL,
+        created_by TEXT,
+        started_at INTEGER NOT NULL,
+        expires_at INTEGER NOT NULL,
+        FOREIGN KEY (class_id) REFERENCES classes(id),
+        FOREIGN KEY (created_by) REFERENCES users(email)
+    )
+    """)
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_attendance_session_class
+    ON attendance_session (class_id, started_at)
+    """)
+    cur.execute("ALTER TABLE attendance ADD COLUMN session_id INTEGER REFERENCES attendance_session(id)")
+    cur.execute("ALTER TABLE otp ADD COLUMN session_id INTEGER REFERENCES attendance_session(id)")
+    cur.execute("""
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_attendance_session_email
+    ON attendance (session_id, email) WHERE session_id IS NOT NULL
+    """)
+    # Keep the latest-OTP lookup answered from the index alone
+    cur.execute("DROP INDEX IF EXISTS idx_otp_class_created")
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_otp_class_created_session
+    ON otp (class_id, created_time, code, session_id)
+    """)
+
+def m008_search_index(cur):
+    # FTS5 indexes behind the typeahead endpoints. Classes have a stable
+    # integer key, so their index reads the text from `classes` itself;
+    # users are keyed by email and VACUUM may renumber their rowids, so
+    # user_search keeps its own copy. prefix= makes "ann"* lookups cheap.
+    cur.execute("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS user_search USING fts5(
+        name, email, role UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+    )
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_users_search_insert AFTER INSERT ON users
+    BEGIN
+        INSERT INTO user_search (name, email, role) VALUES (NEW.name, NEW.email, NEW.role);
+    END
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_users_search_delete AFTER DELETE ON users
+    BEGIN
+        DELETE FROM user_search WHERE email = OLD.email;
+    END
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_users_search_update AFTER UPDATE OF name, email, role ON users
+    BEGIN
+        DELETE FROM user_search WHERE email = OLD.email;
+        INSERT INTO user_search (name, email, role) VALUES (NEW.name, NEW.email, NEW.role);
+    END
+    """)
+    cur.execute("DELETE FROM user_search")
+    cur.execute("INSERT INTO user_search (name, email, role) SELECT name, email, role FROM users")
+
+    cur.execute("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS class_search USING fts5(
+        name, class_code, dept,
+        content = 'classes', content_rowid = 'id',
+        tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+    )
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_classes_search_insert AFTER INSERT ON classes
+    BEGIN
+        INSERT INTO class_search (rowid, name, class_code, dept) VALUES (NEW.id, NEW.name, NEW.class_code, NEW.dept);
+    END
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_classes_search_delete AFTER DELETE ON classes
+    BEGIN
+        INSERT INTO class_search (class_search, rowid, name, class_code, dept)
+        VALUES ('delete', OLD.id, OLD.name, OLD.class_code, OLD.dept);
+    END
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_classes_search_update AFTER UPDATE ON classes
+    BEGIN
+        INSERT INTO class_search (class_search, rowid, name, class_code, dept)
+        VALUES ('delete', OLD.id, OLD.name, OLD.class_code, OLD.dept);
+        INSERT INTO class_search (rowid, name, class_code, dept) VALUES (NEW.id, NEW.name, NEW.class_code, NEW.dept);
+    END
+    """)
+    cur.execute("INSERT INTO class_search (class_search) VALUES ('rebuild')")
+
+MIGRATIONS = [
+    (1, "base schema", m001_base_schema),
+    (2, "hot path indexes", m002_hot_path_indexes),
+    (3, "attendance keyset indexes", m003_attendance_keyset_indexes),
+    (4, "attendance rollups", m004_attendance_rollups),
+    (5, "claims version", m005_claims_version),
+    (6, "attendance archive registry", m006_attendance_archive),
+    (7, "attendance sessions", m007_attendance_sessions),
+    (8, "typeahead search index", m008_search_index),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+# ---------------- RUNNER ----------------
+def current_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(conn, log=print):
+    # Apply pending migrations, each in its own transaction together with
+    # the user_version bump, so a failed step leaves the previous version.
+    conn.isolation_level = None
+    applied = []
+    for version, name, step in MIGRATIONS:
+        if version <= current_version(conn):
+            continue
+        cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            step(cur)
+            cur.execute(f"PRAGMA user_version={version}")
+            cur.execute("COMMIT")
+        except Exception:
+            cur.execute("ROLLBACK")
+            raise
+        log(f"applied migration {version}: {name}")
+        applied.append(version)
+    return applied
+
+def main():
+    conn = sqlite3.connect(DB_PATH)
+    conn.execute("PRAGMA journal_mode=WAL")
+    before = current_version(conn)
+    applied = migrate(conn)
+    if not applied:
+        print(f"schema is up to date (version {before})")
+    conn.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
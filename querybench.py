@@ -0,0 +1,248 @@
+import argparse, hashlib, json, logging, os, re, sqlite3, statistics, sys, time
+
+# Query benchmark for the hot routes. Each route is requested once through
+# the Flask test client against a (seeded) database to capture the SQL it
+# runs; every captured SELECT is then timed on its own and its EXPLAIN
+# QUERY PLAN recorded, and each route is timed end to end. Against a stored
+# baseline, a query or route more than --tolerance times slower, or a plan
+# that now scans a table it used to search, is flagged and the exit
+# status is 1:
+#
+#   python seed.py --db /tmp/big.db --students 150000 --classes 5000 --weeks 36
+#   python querybench.py --db /tmp/big.db --update-baseline   # reference build
+#   python querybench.py --db /tmp/big.db                     # after a change
+#
+# That is the ~20M-row benchmark configuration; seed.py's defaults (~800k
+# rows) are only big enough to check the script runs.
+#
+# The routes write a little (one OTP session and check-in per run), so point
+# it at a seeded copy, not production data.
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "querybench-baseline.json")
+MIN_DELTA_MS = 1.0  # smaller slowdowns are noise however large the ratio
+OTP_RE = re.compile(r"OTP: <b[^>]*>(\d{6})</b>")
+
+def normalize(sql):
+    return " ".join(sql.split())
+
+def query_key(route, sql):
+    return f"{route}:{hashlib.sha1(normalize(sql).encode()).hexdigest()[:10]}"
+
+def scans(plan):
+    # Plan lines that walk a whole table or index rather than a range of it
+    return sorted(d for d in plan if d.startswith("SCAN ")
+                  and "VIRTUAL TABLE" not in d and "CONSTANT ROW" not in d)
+
+def full_scans(plan):
+    # ...of which these read the table itself, in rowid order
+    return [d for d in scans(plan) if "USING" not in d]
+
+def dataset(conn):
+    return {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ("attendance", "student_profile", "classes")}
+
+def same_dataset(a, b):
+    # Each run adds a check-in or two; only a different dataset matters
+    return all(abs(a[t] - b.get(t, 0)) <= max(10, b.get(t, 0) // 1000) for t in a)
+
+def median_ms(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return round(statistics.median(times), 3)
+
+# ---------------- ROUTES ----------------
+def fixtures(conn):
+    # The largest class, its first student and its teacher
+    class_id, student = conn.execute("""
+        SELECT class_id, MIN(email) FROM student_profile
+        GROUP BY class_id ORDER BY COUNT(*) DESC, class_id LIMIT 1
+    """).fetchone()
+    teacher = conn.execute("SELECT MIN(email) FROM teacher_class WHERE class_id=?", (class_id,)).fetchone()[0]
+    return {"class_id": class_id, "student": student, "teacher": teacher}
+
+def routes(fx):
+    # (name, role, method, path, form data)
+    return [
+        ("admin_dashboard", "admin", "GET", "/admin", None),
+        ("admin_dashboard?class_id", "admin", "GET", f"/admin?class_id={fx['class_id']}", None),
+        ("admin_dashboard?email", "admin", "GET", f"/admin?email={fx['student']}", None),
+        ("student_attendance_page", "student", "GET", "/student/attendance", None),
+        ("teacher_classes_page", "teacher", "GET", f"/teacher/classes?class_id={fx['class_id']}", None),
+        ("submit_otp", "student", "POST", "/submit_otp", {"otp": None}),
+    ]
+
+class Recorder:
+    # Collects the statements of the request being run from its connections
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, sender, response, **extra):
+        from flask import g
+        for name in ("db", "report_db"):
+            conn = g.get(name)
+            if conn is not None and conn.statements:
+                self.statements.extend(conn.statements)
+
+def run_routes(cloud_app, fx, repeat):
+    from flask import request_finished
+    password = os.environ.get("QUERYBENCH_PASSWORD", "seed")
+    logins = {"admin": ("admin@cloud.com", "admin123"), "student": (fx["student"], password),
+              "teacher": (fx["teacher"], password)}
+    clients = {}
+    for role, (email, pw) in logins.items():
+        clients[role] = cloud_app.app.test_client()
+        resp = clients[role].post("/", data={"email": email, "password": pw, "role": role})
+        if resp.status_code != 302:
+            raise SystemExit(f"login failed for {role} {email}; is this a seeded database?")
+
+    cloud_app.app.config["RECORD_SQL"] = True
+    results = {}
+    for name, role, method, path, data in routes(fx):
+        if data and "otp" in data:
+            # A fresh OTP for the class, as the teacher would generate it
+            text = clients["teacher"].post("/generate_otp", data={"class_id": fx["class_id"]}).get_data(as_text=True)
+            data = {"otp": OTP_RE.search(text).group(1)}
+        client = clients[role]
+        call = (lambda: client.get(path)) if method == "GET" else (lambda: client.post(path, data=data))
+        recorder = Recorder()
+        request_finished.connect(recorder, cloud_app.app)
+        status = call().status_code
+        request_finished.disconnect(recorder, cloud_app.app)
+        results[name] = {"path": path, "status": status, "statements": recorder.statements,
+                         "ms": median_ms(call, repeat)}
+    cloud_app.app.config["RECORD_SQL"] = False
+    return results
+
+# ---------------- QUERIES ----------------
+def measure_queries(conn, route, statements, repeat):
+    measured = {}
+    for args in statements:
+        sql, params = args[0], (args[1] if len(args) > 1 else ())
+        if not normalize(sql).upper().startswith(("SELECT", "WITH")):
+            continue
+        key = query_key(route, sql)
+        if key in measured:
+            continue
+        try:
+            plan = [r[3] for r in conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()]
+            ms = median_ms(lambda: conn.execute(sql, params).fetchall(), repeat)
+        except sqlite3.Error as e:
+            # e.g. a query on an archive the route had attached
+            measured[key] = {"route": route, "sql": normalize(sql), "error": str(e)}
+            continue
+        measured[key] = {"route": route, "sql": normalize(sql), "ms": ms, "plan": plan}
+    return measured
+
+def measure_writer_insert(conn, insert_sql, fx, repeat):
+    # The attendance writer's batch insert for the session submit_otp just
+    # used, rolled back each time. Commit timing is noisy, so more samples.
+    session_id = conn.execute("SELECT MAX(id) FROM attendance_session WHERE class_id=?",
+                              (fx["class_id"],)).fetchone()[0]
+    emails = [r[0] for r in conn.execute("SELECT email FROM student_profile WHERE class_id=? LIMIT 64",
+                                         (fx["class_id"],))]
+    rows = [(email, fx["class_id"], int(time.time()), session_id) for email in emails]
+
+    def insert():
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany(insert_sql, rows)
+        conn.rollback()
+
+    return {"route": "submit_otp (writer batch)", "sql": normalize(insert_sql),
+            "ms": median_ms(insert, repeat * 4), "plan": [], "rows": len(rows)}
+
+# ---------------- COMPARE ----------------
+def compare(report, baseline, tolerance):
+    problems = []
+
+    def slower(label, ms, base_ms):
+        if base_ms is not None and ms > base_ms * tolerance and ms - base_ms > MIN_DELTA_MS:
+            problems.append(f"{label}: {ms}ms vs {base_ms}ms baseline")
+
+    for name, r in report["routes"].items():
+        slower(f"route {name}", r["ms"], baseline.get("routes", {}).get(name, {}).get("ms"))
+    for key, q in report["queries"].items():
+        base = baseline.get("queries", {}).get(key)
+        if not base or "ms" not in q or "ms" not in base:
+            continue
+        slower(f"query {key}", q["ms"], base["ms"])
+        new_scans = set(scans(q["plan"])) - set(scans(base["plan"]))
+        if new_scans:
+            problems.append(f"query {key}: plan now has {', '.join(sorted(new_scans))}")
+    return problems
+
+def print_report(report):
+    d = report["dataset"]
+    print(f"{d['attendance']} attendance rows, {d['student_profile']} students, {d['classes']} classes")
+    print(f"{'route':<28}{'status':>7}{'ms':>10}{'queries':>9}")
+    for name, r in report["routes"].items():
+        print(f"{name:<28}{r['status']:>7}{r['ms']:>10}{r['queries']:>9}")
+    print()
+    for key, q in report["queries"].items():
+        if "error" in q:
+            print(f"{key}  not replayable: {q['error']}")
+            continue
+        flag = "  FULL SCAN" if full_scans(q["plan"]) else ""
+        print(f"{key}  {q['ms']}ms{flag}\n    {q['sql'][:150]}")
+        for line in q["plan"]:
+            print(f"      {line}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the hot routes' queries and compare with a baseline")
+    parser.add_argument("--db", required=True, help="database to run against (see seed.py)")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per route/query (median is kept)")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--update-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=2.0, help="flag anything this many times slower")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args(argv)
+
+    # app.py reads these at import time. The one student submits an OTP on
+    # every timed run, more often than its per-student bucket allows.
+    os.environ["CLOUD_ATTENDANCE_DB"] = os.path.abspath(args.db)
+    os.environ.setdefault("CLOUD_ATTENDANCE_RATE_LIMITS", "submit_otp.user=0/60")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as cloud_app
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    conn = cloud_app.connect()
+    fx = fixtures(conn)
+    report = {"dataset": dataset(conn), "routes": {}, "queries": {}}
+    route_results = run_routes(cloud_app, fx, args.repeat)
+    cloud_app.attendance_writer.stop()
+
+    for name, r in route_results.items():
+        report["routes"][name] = {"path": r["path"], "status": r["status"], "ms": r["ms"],
+                                  "queries": len(r["statements"])}
+        report["queries"].update(measure_queries(conn, name, r["statements"], args.repeat))
+    report["queries"]["submit_otp:writer"] = measure_writer_insert(conn, cloud_app.AttendanceWriter.INSERT_SQL, fx, args.repeat)
+    conn.close()
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nbaseline written to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"\nno baseline at {args.baseline}; run with --update-baseline first")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if not same_dataset(report["dataset"], baseline.get("dataset", {})):
+        print(f"\nwarning: baseline dataset {baseline.get('dataset')} differs from this one", file=sys.stderr)
+    problems = compare(report, baseline, args.tolerance)
+    for problem in problems:
+        print(f"REGRESSION: {problem}", file=sys.stderr)
+    if not problems:
+        print("\nno regressions against the baseline")
+    return 1 if problems else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,194 @@
+import argparse, os, random, sqlite3, sys, time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+# Synthetic dataset for query benchmarks. Builds a new database through the
+# real migrations, then bulk-inserts classes with weekly schedules,
+# teachers, students and one attendance session per scheduled class
+# meeting over the term, each attended by most of the class. Indexes and
+# triggers on the bulk tables are dropped during the load and rebuilt
+# afterwards, together with the rollups and search index. The defaults are
+# a quick smoke-sized set; the second line is the benchmark configuration
+# that querybench baselines are taken on:
+#
+#   python seed.py --db /tmp/seed.db                                   # ~800k attendance rows
+#   python seed.py --db /tmp/big.db --students 150000 --classes 5000 --weeks 36   # ~20M
+#
+# Every seeded user's password is PASSWORD.
+
+PASSWORD = "seed"
+DEPTS = ["CS", "IT", "ECE", "EEE", "ME", "CE", "MBA", "MATH"]
+FIRST = ["Aarav", "Aditi", "Akash", "Ananya", "Arjun", "Divya", "Farhan", "Gauri", "Harsh", "Isha",
+         "Karan", "Kavya", "Manav", "Meera", "Nikhil", "Pooja", "Rahul", "Riya", "Sanjay", "Sneha",
+         "Tanvi", "Varun", "Vikram", "Yash", "Zoya"]
+LAST = ["Sharma", "Patel", "Reddy", "Iyer", "Nair", "Khan", "Gupta", "Rao", "Das", "Menon",
+        "Joshi", "Kumar", "Singh", "Verma", "Pillai"]
+DAY_NAMES = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"]
+SLOTS = [("08:00", "09:00"), ("09:00", "10:00"), ("10:15", "11:15"), ("11:15", "12:15"),
+         ("13:30", "14:30"), ("14:30", "15:30"), ("15:45", "16:45")]
+BULK_TABLES = ("users", "classes", "class_schedule", "student_profile", "teacher_profile",
+               "teacher_class", "attendance", "attendance_session")
+
+def log(msg):
+    print(msg, flush=True)
+
+@contextmanager
+def deferred_indexes(conn):
+    # Drops the bulk tables' indexes and every trigger, then recreates them
+    # from their stored SQL: one sorted build per index instead of a random
+    # b-tree insert per row
+    placeholders = ",".join("?" * len(BULK_TABLES))
+    saved = conn.execute(f"""
+        SELECT type, name, sql FROM sqlite_master
+        WHERE sql IS NOT NULL AND (type = 'trigger' OR (type = 'index' AND tbl_name IN ({placeholders})))
+    """, BULK_TABLES).fetchall()
+    for kind, name, _ in saved:
+        conn.execute(f"DROP {kind.upper()} {name}")
+    yield
+    for kind, name, sql in saved:
+        if kind == "index":
+            started = time.perf_counter()
+            conn.execute(sql)
+            log(f"  index {name}: {time.perf_counter() - started:.1f}s")
+    for kind, _, sql in saved:
+        if kind == "trigger":
+            conn.execute(sql)
+
+def seed(conn, students, classes, weeks, start, rate, rng):
+    cur = conn.cursor()
+    # Classes, each with 2-4 weekly meetings in one slot
+    class_rows = []
+    for i in range(classes):
+        dept = DEPTS[i % len(DEPTS)]
+        class_rows.append((f"{dept}-{i // len(DEPTS) + 1:04d}", dept, f"{dept}{i:05d}"))
+    last_id = cur.execute("SELECT COALESCE(MAX(id), 0) FROM classes").fetchone()[0]
+    cur.executemany("INSERT INTO classes (name, dept, class_code) VALUES (?, ?, ?)", class_rows)
+    class_ids = [r[0] for r in cur.execute("SELECT id FROM classes WHERE id > ? ORDER BY id", (last_id,))]
+    meetings = {}  # weekday -> [(class_id, start "HH:MM")]
+    schedule = []
+    for class_id in class_ids:
+        slot = rng.choice(SLOTS)
+        for wd in sorted(rng.sample(range(5), rng.randint(2, 4))):
+            schedule.append((class_id, DAY_NAMES[wd], *slot))
+            meetings.setdefault(wd, []).append((class_id, slot[0]))
+    cur.executemany("INSERT INTO class_schedule (class_id, day, start_time, end_time) VALUES (?, ?, ?, ?)", schedule)
+
+    # Teachers take three classes each
+    teachers = []
+    for i in range(0, len(class_ids), 3):
+        email = f"teacher{i // 3}@seed.test"
+        teachers.append((email, class_rows[i][1], class_ids[i:i + 3]))
+    cur.executemany("INSERT INTO users (email, password, role, name) VALUES (?, ?, 'teacher', ?)",
+                    [(t[0], PASSWORD, f"{rng.choice(FIRST)} {rng.choice(LAST)}") for t in teachers])
+    cur.executemany("INSERT INTO teacher_profile (email, dept) VALUES (?, ?)", [(t[0], t[1]) for t in teachers])
+    cur.executemany("INSERT INTO teacher_class (email, class_id) VALUES (?, ?)",
+                    [(t[0], c) for t in teachers for c in t[2]])
+    teacher_of = {c: t[0] for t in teachers for c in t[2]}
+
+    # Students, one class each, each with their own attendance habit
+    roster = {class_id: [] for class_id in class_ids}
+    users = []
+    for i in range(students):
+        first, last = rng.choice(FIRST), rng.choice(LAST)
+        email = f"{first}.{last}{i}@seed.test".lower()
+        users.append((email, PASSWORD, f"{first} {last}"))
+        roster[rng.choice(class_ids)].append((email, min(1.0, max(0.2, rng.gauss(rate, 0.12)))))
+    cur.executemany("INSERT INTO users (email, password, role, name) VALUES (?, ?, 'student', ?)", users)
+    cur.executemany("INSERT INTO student_profile (email, class_id) VALUES (?, ?)",
+                    [(email, class_id) for class_id, group in roster.items() for email, _ in group])
+    conn.commit()
+    log(f"  {len(class_ids)} classes, {len(teachers)} teachers, {students} students")
+
+    # One attendance session per meeting, in time order; check-ins land in
+    # the first ten minutes
+    session_id = cur.execute("SELECT COALESCE(MAX(id), 0) FROM attendance_session").fetchone()[0]
+    marked = 0
+    for week in range(weeks):
+        sessions, attendance = [], []
+        for wd in range(5):
+            day = start + timedelta(days=7 * week + wd)
+            for class_id, hhmm in meetings.get(wd, ()):
+                session_id += 1
+                started = int(datetime.combine(day, datetime.strptime(hhmm, "%H:%M").time()).timestamp())
+                sessions.append((session_id, class_id, teacher_of[class_id], started, started + 60))
+                for email, habit in roster[class_id]:
+                    if rng.random() < habit:
+                        attendance.append((email, class_id, started + rng.randrange(600), session_id))
+        attendance.sort(key=lambda r: r[2])
+        cur.executemany("INSERT INTO attendance_session (id, class_id, created_by, started_at, expires_at) "
+                        "VALUES (?, ?, ?, ?, ?)", sessions)
+        cur.executemany("INSERT INTO attendance (email, class_id, timestamp, session_id) VALUES (?, ?, ?, ?)",
+                        attendance)
+        conn.commit()
+        marked += len(attendance)
+        log(f"  week {week + 1}/{weeks}: {marked} attendance rows")
+    return marked
+
+def rebuild_derived(conn):
+    # Same as the migrations' backfills: rollups (class_daily via its
+    # trigger) and the search indexes
+    conn.execute("DELETE FROM attendance_daily")
+    conn.execute("DELETE FROM class_daily")
+    conn.execute("""
+        INSERT INTO attendance_daily (email, class_id, day, marks)
+        SELECT email, class_id, date(timestamp, 'unixepoch', 'localtime'), COUNT(*)
+        FROM attendance
+        GROUP BY 1, 2, 3
+    """)
+    conn.execute("DELETE FROM user_search")
+    conn.execute("INSERT INTO user_search (name, email, role) SELECT name, email, role FROM users")
+    conn.execute("INSERT INTO class_search (class_search) VALUES ('rebuild')")
+    conn.commit()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a large synthetic cloud-attendance database")
+    parser.add_argument("--db", required=True, help="database file to create")
+    parser.add_argument("--students", type=int, default=20000)
+    parser.add_argument("--classes", type=int, default=800)
+    parser.add_argument("--weeks", type=int, default=16, help="length of the term")
+    parser.add_argument("--start", type=date.fromisoformat,
+                        help="first Monday of the term (default: so the term ends last week)")
+    parser.add_argument("--rate", type=float, default=0.85, help="average attendance rate")
+    parser.add_argument("--seed", type=int, default=1, help="random seed, for repeatable datasets")
+    parser.add_argument("--force", action="store_true", help="replace an existing file")
+    args = parser.parse_args(argv)
+
+    if os.path.exists(args.db):
+        if not args.force:
+            parser.error(f"{args.db} exists (use --force to replace it)")
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(args.db + suffix):
+                os.remove(args.db + suffix)
+    today = date.today()
+    start = args.start or today - timedelta(days=today.weekday() + 7 * args.weeks)
+    start -= timedelta(days=start.weekday())
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import migrations
+    started = time.perf_counter()
+    conn = sqlite3.connect(args.db)
+    migrations.migrate(conn, log=lambda msg: None)
+    conn.isolation_level = ""
+    # A throwaway file: no journal, no fsync while loading
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA cache_size=-262144")
+    conn.execute("PRAGMA temp_store=MEMORY")
+
+    log(f"seeding {args.db}: term of {args.weeks} weeks from {start}")
+    with deferred_indexes(conn):
+        marked = seed(conn, args.students, args.classes, args.weeks, start, args.rate, random.Random(args.seed))
+        log("rebuilding indexes")
+    log("rebuilding rollups and search index")
+    rebuild_derived(conn)
+    # The migrations analyzed empty tables; stats that say "classes has one
+    # row" would have the planner scan it in every join
+    conn.execute("ANALYZE")
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.close()
+    log(f"done: {marked} attendance rows in {time.perf_counter() - started:.1f}s "
+        f"({os.path.getsize(args.db) / 2**20:.0f} MiB); password for every user: {PASSWORD}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
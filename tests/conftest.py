@@ -0,0 +1,58 @@
+import os, shutil, sqlite3, sys, tempfile
+
+import pytest
+
+# app.py reads its settings and checks the schema version at import, so the
+# test database is created and migrated here, before any test imports it.
+TMP_DIR = tempfile.mkdtemp(prefix="cloud-attendance-tests-")
+os.environ["CLOUD_ATTENDANCE_DB"] = os.path.join(TMP_DIR, "test.db")
+os.environ["CLOUD_ATTENDANCE_ARCHIVE_DIR"] = os.path.join(TMP_DIR, "archive")
+os.environ.pop("CLOUD_ATTENDANCE_RATE_LIMITS", None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import migrations
+
+def migrated(path):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    migrations.migrate(conn, log=lambda message: None)
+    conn.close()
+    return path
+
+migrated(os.environ["CLOUD_ATTENDANCE_DB"])
+
+import app as cloud_app
+
+def pytest_sessionfinish(session, exitstatus):
+    cloud_app.attendance_writer.stop()
+    shutil.rmtree(TMP_DIR, ignore_errors=True)
+
+@pytest.fixture
+def conn():
+    # A connection to the shared test database; attendance, sessions and
+    # archives added by the test are removed afterwards
+    conn = cloud_app.connect()
+    yield conn
+    conn.rollback()
+    conn.isolation_level = ""
+    conn.execute("DELETE FROM attendance")
+    conn.execute("DELETE FROM attendance_session")
+    conn.execute("DELETE FROM attendance_archive")
+    conn.execute("DELETE FROM student_profile")
+    conn.execute("DELETE FROM users WHERE role != 'admin'")
+    conn.commit()
+    conn.close()
+    shutil.rmtree(cloud_app.ARCHIVE_DIR, ignore_errors=True)
+    cloud_app.read_cache.clear()
+
+@pytest.fixture
+def student(conn):
+    conn.execute("INSERT INTO users (email, password, role, name) VALUES ('s@test', 'p', 'student', 'S')")
+    conn.execute("INSERT INTO student_profile (email, class_id) VALUES ('s@test', 1)")
+    conn.commit()
+    return "s@test"
+
+@pytest.fixture
+def empty_db(tmp_path):
+    # A freshly migrated database of its own, for code that takes a path
+    return migrated(str(tmp_path / "empty.db"))
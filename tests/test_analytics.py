@@ -0,0 +1,92 @@
+import random, sqlite3, time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pytest
+
+import analytics
+
+# Spans the 2026 spring DST change in America/New_York
+START, END = date(2026, 2, 2), date(2026, 4, 26)
+SCHEDULE = {1: ("Monday", "Wednesday", "Friday"), 2: ("Tuesday", "Thursday")}
+
+@pytest.fixture(params=["UTC", "America/New_York", "Asia/Kolkata"])
+def timezone(request, monkeypatch):
+    monkeypatch.setenv("TZ", request.param)
+    time.tzset()
+    yield request.param
+    monkeypatch.undo()
+    time.tzset()
+
+@pytest.fixture
+def db(empty_db, timezone):
+    rng = random.Random(7)
+    conn = sqlite3.connect(empty_db)
+    conn.execute("INSERT INTO classes (id, name, dept, class_code) VALUES (2, 'IT-B', 'IT', 'IT124')")
+    conn.execute("INSERT INTO classes (id, name, dept, class_code) VALUES (3, 'IT-C', 'IT', 'IT125')")
+    conn.execute("DELETE FROM class_schedule")
+    conn.executemany("INSERT INTO class_schedule (class_id, day, start_time, end_time) VALUES (?, ?, '09:00', '10:00')",
+                     [(cid, day) for cid, days in SCHEDULE.items() for day in days])
+    students = [(f"s{i}@test", 1 + i % 3) for i in range(12)]
+    conn.executemany("INSERT INTO users (email, password, role, name) VALUES (?, 'p', 'student', ?)",
+                     [(email, email) for email, _ in students])
+    conn.executemany("INSERT INTO student_profile (email, class_id) VALUES (?, ?)", students)
+
+    rows = []
+    day = START - timedelta(days=3)  # a few rows outside the range too
+    while day <= END + timedelta(days=3):
+        for email, class_id in students + [("gone@test", 1)]:  # no users row: excluded
+            if rng.random() < 0.6:
+                # Early and late hours fall on another UTC day in some zones;
+                # a few students check in twice
+                for _ in range(2 if rng.random() < 0.15 else 1):
+                    at = datetime.combine(day, datetime.min.time()) + timedelta(
+                        hours=rng.choice([1, 2, 3, 8, 9, 13, 17, 22, 23]), minutes=rng.randrange(60))
+                    rows.append((email, class_id, int(at.timestamp())))
+        day += timedelta(days=1)
+    conn.executemany("INSERT INTO attendance (email, class_id, timestamp) VALUES (?, ?, ?)", rows)
+    conn.commit()
+    yield conn
+    conn.close()
+
+def day_range():
+    start_ts = int(datetime.combine(START, datetime.min.time()).timestamp())
+    end_ts = int(datetime.combine(END + timedelta(days=1), datetime.min.time()).timestamp())
+    return start_ts, end_ts
+
+def weekdays():
+    return {cid: {analytics.DAY_NAMES.index(d) for d in days} for cid, days in SCHEDULE.items()}
+
+def test_heatmap_matches_sql(db):
+    cols = analytics.load_columns(db, *day_range())
+    assert len(cols) > 500
+    assert np.array_equal(analytics.heatmap(cols), analytics.sql_heatmap(db, *day_range()))
+
+def test_class_rates_match_sql(db):
+    cols = analytics.load_columns(db, *day_range())
+    enrolled = {1: 4, 2: 4, 3: 4}
+    rates = analytics.class_rates(cols, weekdays(), enrolled, {1: 36, 2: 24})
+    present = analytics.sql_class_present(db, *day_range(), weekdays())
+    assert {cid: r["present"] for cid, r in rates.items()} == {1: present[1], 2: present[2], 3: 0}
+    assert rates[1]["expected"] == 4 * 36
+    assert rates[1]["percent"] == round(100.0 * present[1] / (4 * 36), 1)
+    assert rates[3]["percent"] is None
+
+def test_weekly_trend_matches_sql(db):
+    cols = analytics.load_columns(db, *day_range())
+    weeks = analytics.weekly_trend(cols, START, END)
+    checkins = analytics.sql_weekly(db, *day_range(), START)
+    student_days = dict(db.execute("""
+        SELECT CAST((julianday(d) - julianday(?)) / 7 AS INTEGER), COUNT(*)
+        FROM (SELECT DISTINCT a.email, a.class_id, date(a.timestamp, 'unixepoch', 'localtime') AS d
+              FROM attendance a JOIN users u ON u.email = a.email
+              WHERE a.timestamp >= ? AND a.timestamp < ?)
+        GROUP BY 1
+    """, (START.isoformat(), *day_range())).fetchall())
+    assert [w["week"] for w in weeks] == [START + timedelta(weeks=i) for i in range(12)]
+    assert [w["checkins"] for w in weeks] == [checkins.get(i, 0) for i in range(12)]
+    assert [w["student_days"] for w in weeks] == [student_days.get(i, 0) for i in range(12)]
+
+def test_benchmark_checks_pass(db, empty_db, capsys):
+    assert analytics.benchmark(empty_db, START, END)
+    assert " NO" not in capsys.readouterr().out
@@ -0,0 +1,106 @@
+import threading, time
+
+import app as cloud_app
+
+def open_sessions(conn, n):
+    now = int(time.time())
+    ids = [cloud_app.open_session(conn.cursor(), None, 1, now, now + 60) for _ in range(n)]
+    conn.commit()
+    return ids
+
+def add_students(conn, n):
+    emails = [f"s{i}@test" for i in range(n)]
+    conn.executemany("INSERT INTO users (email, password, role, name) VALUES (?, 'p', 'student', ?)",
+                     [(e, e) for e in emails])
+    conn.executemany("INSERT INTO student_profile (email, class_id) VALUES (?, 1)", [(e,) for e in emails])
+    conn.commit()
+    return emails
+
+def recording(writer):
+    # The batches the writer commits, as lists of PendingWrite
+    batches = []
+    flush = writer._flush
+    def record(conn, batch):
+        batches.append(batch)
+        flush(conn, batch)
+    writer._flush = record
+    return batches
+
+def attendance_count(conn):
+    return conn.execute("SELECT COUNT(*) FROM attendance").fetchone()[0]
+
+def test_concurrent_submits_share_commits(conn):
+    emails = add_students(conn, 16)
+    [session_id] = open_sessions(conn, 1)
+    writer = cloud_app.AttendanceWriter(durability="sync", flush_delay=0.5)
+    batches = recording(writer)
+    results = {}
+    start = threading.Barrier(len(emails))
+
+    def submit(email):
+        start.wait()
+        results[email] = writer.submit(email, 1, int(time.time()), session_id)
+
+    threads = [threading.Thread(target=submit, args=(e,)) for e in emails]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    writer.stop()
+
+    assert results == {e: True for e in emails}
+    assert sum(map(len, batches)) == len(emails)
+    assert len(batches) < len(emails)
+    assert attendance_count(conn) == len(emails)
+
+def test_batches_are_capped_at_batch_size(conn):
+    emails = add_students(conn, 10)
+    [session_id] = open_sessions(conn, 1)
+    writer = cloud_app.AttendanceWriter(durability="async", batch_size=4, flush_delay=0.5)
+    batches = recording(writer)
+    for email in emails:
+        writer.submit(email, 1, int(time.time()), session_id)
+    writer.stop()
+
+    assert max(map(len, batches)) <= 4
+    assert sum(map(len, batches)) == len(emails)
+    assert attendance_count(conn) == len(emails)
+
+def test_repeat_submission_for_a_session_is_ignored(conn, student):
+    first, second = open_sessions(conn, 2)
+    writer = cloud_app.AttendanceWriter(durability="async", flush_delay=0.2)
+    batches = recording(writer)
+    now = int(time.time())
+    for session_id in (first, first, second, first):
+        writer.submit(student, 1, now, session_id)
+    writer.stop()
+
+    # One batch; ON CONFLICT drops the repeats instead of failing it
+    assert [len(b) for b in batches] == [4]
+    assert all(p.ok for p in batches[0])
+    rows = conn.execute("SELECT session_id FROM attendance WHERE email=? ORDER BY session_id",
+                        (student,)).fetchall()
+    assert [r[0] for r in rows] == [first, second]
+
+def test_repeat_in_a_later_batch_still_succeeds(conn, student):
+    [session_id] = open_sessions(conn, 1)
+    writer = cloud_app.AttendanceWriter(durability="sync", flush_delay=0)
+    assert writer.submit(student, 1, int(time.time()), session_id)
+    assert writer.submit(student, 1, int(time.time()), session_id)
+    writer.stop()
+    assert attendance_count(conn) == 1
+
+def test_bad_row_does_not_fail_its_batch(conn):
+    emails = add_students(conn, 3)
+    [session_id] = open_sessions(conn, 1)
+    writer = cloud_app.AttendanceWriter(durability="async", flush_delay=0.2)
+    batches = recording(writer)
+    now = int(time.time())
+    writer.submit(emails[0], 1, now, session_id)
+    writer.submit("nobody@test", 1, now, session_id)  # not a user: foreign key violation
+    writer.submit(emails[1], 1, now, session_id)
+    writer.stop()
+
+    assert [[p.ok for p in b] for b in batches] == [[True, False, True]]
+    rows = conn.execute("SELECT email FROM attendance ORDER BY email").fetchall()
+    assert [r[0] for r in rows] == [emails[0], emails[1]]
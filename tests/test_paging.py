@@ -0,0 +1,78 @@
+import time
+from datetime import date, timedelta
+
+import pytest
+
+import app as cloud_app
+
+SELECT_SQL = "SELECT a.id, a.email, a.timestamp FROM {attendance} a"
+DAY = 86400
+
+@pytest.fixture
+def history(conn, student):
+    # A check-in every third day for 400 days, two terms of it archived
+    now = int(time.time())
+    conn.executemany("INSERT INTO attendance (email, class_id, timestamp) VALUES (?, 1, ?)",
+                     [(student, now - DAY * d) for d in range(0, 400, 3)])
+    # Two check-ins in the same second, so the id breaks the tie
+    conn.execute("INSERT INTO attendance (email, class_id, timestamp) VALUES (?, 1, ?)", (student, now - DAY * 30))
+    conn.commit()
+    rows = conn.execute("SELECT id, timestamp FROM attendance ORDER BY timestamp DESC, id DESC").fetchall()
+    for name, days_ago in (("t1", 300), ("t2", 100)):
+        cutoff = cloud_app.parse_day((date.today() - timedelta(days=days_ago)).isoformat())
+        assert cloud_app.archive_term(conn, name, cutoff) > 0
+    return [(r["timestamp"], r["id"]) for r in rows]
+
+def read_pages(conn, query=""):
+    # Follows the next-page cursor to the end; returns the (timestamp, id) of
+    # every row and the number of pages
+    cur = conn.cursor()
+    seen, pages, before = [], 0, None
+    while True:
+        url = "/?limit=7" + query + (f"&before={before}" if before else "")
+        with cloud_app.app.test_request_context(url):
+            args = cloud_app.request.args
+            where, params = [], []
+            cloud_app.attendance_filters(args, where, params)
+            rows, before = cloud_app.fetch_attendance_page(cur, SELECT_SQL, where, params,
+                                                           cloud_app.filter_range(args))
+        seen += [(r["timestamp"], r["id"]) for r in rows]
+        pages += 1
+        if before is None:
+            return seen, pages
+
+def test_archives_are_registered(conn, history):
+    archived = conn.execute("SELECT SUM(row_count) FROM attendance_archive").fetchone()[0]
+    hot = conn.execute("SELECT COUNT(*) FROM attendance").fetchone()[0]
+    assert archived + hot == len(history)
+    assert len(cloud_app.archives_in_range(conn.cursor())) == 2
+
+def test_pages_cover_every_term_in_order(conn, history):
+    seen, pages = read_pages(conn)
+    assert seen == history
+    assert pages == -(-len(history) // 7)
+
+def test_no_archive_left_attached(conn, history):
+    read_pages(conn)
+    assert [r[1] for r in conn.execute("PRAGMA database_list")] == ["main"]
+
+def test_first_page_does_not_attach_archives(conn, history, monkeypatch):
+    attached = []
+    real = cloud_app.attached_archive
+    monkeypatch.setattr(cloud_app, "attached_archive",
+                        lambda cur, archive: attached.append(archive["name"]) or real(cur, archive))
+    with cloud_app.app.test_request_context("/?limit=7"):
+        rows, _ = cloud_app.fetch_attendance_page(conn.cursor(), SELECT_SQL, [], [])
+    assert len(rows) == 7
+    assert attached == []
+
+def test_date_range_reads_only_matching_terms(conn, history, monkeypatch):
+    attached = []
+    real = cloud_app.attached_archive
+    monkeypatch.setattr(cloud_app, "attached_archive",
+                        lambda cur, archive: attached.append(archive["name"]) or real(cur, archive))
+    start, end = date.today() - timedelta(days=350), date.today() - timedelta(days=320)
+    seen, _ = read_pages(conn, f"&from={start}&to={end}")
+    lo, hi = cloud_app.parse_day(start.isoformat()), cloud_app.parse_day(end.isoformat(), end=True)
+    assert seen == [row for row in history if lo <= row[0] < hi]
+    assert set(attached) == {"t1"}
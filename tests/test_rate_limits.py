@@ -0,0 +1,53 @@
+import pytest
+
+import app as cloud_app
+from app import RATE_LIMITS, RateLimiter, parse_rate_limits
+
+def test_defaults():
+    limits = parse_rate_limits(RATE_LIMITS, None)
+    assert limits["submit_otp"]["user"] == (5, 5 / 60)
+    assert limits["login"]["ip"] == (600, 10)
+
+def test_override_replaces_one_scope():
+    limits = parse_rate_limits(RATE_LIMITS, "submit_otp.user=3/10, login.ip=100/20")
+    assert limits["submit_otp"]["user"] == (3, 0.3)
+    assert limits["submit_otp"]["ip"] == (600, 10)
+    assert limits["login"]["ip"] == (100, 5)
+
+def test_override_adds_a_route():
+    limits = parse_rate_limits({}, "api_check_otp.user=2/4")
+    assert limits == {"api_check_otp": {"user": (2, 0.5)}}
+
+def test_zero_capacity_disables_a_limit():
+    limits = parse_rate_limits(RATE_LIMITS, "submit_otp.user=0/60,login.user=0/1,login.ip=0/1")
+    assert "user" not in limits["submit_otp"]
+    assert "login" not in limits
+
+@pytest.mark.parametrize("spec", [
+    "submit_otp.user",
+    "submit_otp=5/60",
+    "submit_otp.user.x=5/60",
+    "submit_otp.user=5/60=1",
+])
+def test_malformed_item(spec):
+    with pytest.raises(ValueError, match="expected route.scope=capacity/seconds"):
+        parse_rate_limits(RATE_LIMITS, spec)
+
+@pytest.mark.parametrize("rate", ["5/0", "5/-60", "-1/60", "five/60", "5", "5/60/2", ""])
+def test_bad_rate_names_the_setting(rate):
+    with pytest.raises(ValueError, match=f"Bad rate limit submit_otp.user={rate}"):
+        parse_rate_limits(RATE_LIMITS, f"submit_otp.user={rate}")
+
+def test_limiter_rejects_when_a_bucket_is_empty(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cloud_app.time, "monotonic", lambda: now[0])
+    limiter = RateLimiter(parse_rate_limits({}, "submit_otp.user=2/10,submit_otp.ip=3/10"))
+    keys = {"user": "a@test", "ip": "10.0.0.1"}
+    assert limiter.check("submit_otp", keys) is None
+    assert limiter.check("submit_otp", keys) is None
+    assert limiter.check("submit_otp", keys) == ("user", 1 / 0.2)
+    # A rejected request takes no token from the other buckets
+    assert limiter.check("submit_otp", {"user": "b@test", "ip": "10.0.0.1"}) is None
+    assert limiter.check("submit_otp", {"user": "c@test", "ip": "10.0.0.1"}) == ("ip", 1 / 0.3)
+    now[0] += 5
+    assert limiter.check("submit_otp", keys) is None